@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import discord
+
+import card_cache
+import card_fetcher
+import metrics
+import winston_bot
+from benchmarks.run_benchmarks import gitRevision, saveResults, summarize
+from benchmarks.scryfall_stub import ScryfallStub
+from draft_session import SessionManager
+from draft_state import Action
+
+RESULTS_DIR = 'benchmarks/results/load'
+
+_ids = itertools.count(1000)
+
+
+class FakeMember:
+    def __init__(self, name) -> None:
+        self.id = next(_ids)
+        self.display_name = name
+        self.mention = f"<@{self.id}>"
+
+
+class FakeGuild:
+    def __init__(self, members) -> None:
+        self.members = {member.id: member for member in members}
+
+    async def fetch_member(self, member_id):
+        return self.members[member_id]
+
+
+class FakeMessage:
+    def __init__(self, channel, content=None, **kwargs) -> None:
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.kwargs = kwargs
+
+    async def edit(self, **kwargs):
+        self.channel.edits += 1
+        await asyncio.sleep(self.channel.api_latency)
+        self.kwargs.update(kwargs)
+
+    async def delete(self):
+        await asyncio.sleep(self.channel.api_latency)
+
+
+class FakeThread:
+    # Stands in for the game thread, which is also the ctx the bot's views hold
+    def __init__(self, guild, api_latency) -> None:
+        self.id = next(_ids)
+        self.guild = guild
+        self.api_latency = api_latency
+        self.messages = []
+        self.edits = 0
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(self.api_latency)
+        message = FakeMessage(self, content, **kwargs)
+        self.messages.append(message)
+        return message
+
+
+class FakeResponse:
+    # Enforces Discord's one response per interaction and records when it arrived
+    def __init__(self, interaction) -> None:
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def _respond(self):
+        if self._done:
+            raise discord.InteractionResponded(self._interaction)
+        self._done = True
+        await asyncio.sleep(self._interaction.api_latency)
+        self._interaction.acknowledged()
+
+    async def send_message(self, content=None, **kwargs):
+        await self._respond()
+
+    async def edit_message(self, **kwargs):
+        await self._respond()
+
+    async def defer(self, **kwargs):
+        await self._respond()
+
+    async def send_modal(self, modal):
+        await self._respond()
+
+
+class FakeFollowup:
+    def __init__(self, interaction) -> None:
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        if not self._interaction.response.is_done():
+            raise discord.NotFound(None, "Unknown Webhook")
+        await asyncio.sleep(self._interaction.api_latency)
+        return FakeMessage(self._interaction.channel, content, **kwargs)
+
+
+class FakeInteraction:
+    def __init__(self, user, channel, api_latency) -> None:
+        self.id = next(_ids)
+        self.user = user
+        self.channel = channel
+        self.guild = channel.guild
+        self.api_latency = api_latency
+        self.data = {}
+        self.extras = {}
+
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+        self.created = time.perf_counter()
+        self.created_at = discord.utils.utcnow()
+        self.ack_delay = None
+
+    def acknowledged(self):
+        self.ack_delay = time.perf_counter() - self.created
+
+    async def edit_original_response(self, **kwargs):
+        if not self.response.is_done():
+            raise discord.NotFound(None, "Unknown Message")
+        self.channel.edits += 1
+        await asyncio.sleep(self.api_latency)
+
+    async def original_response(self):
+        return FakeMessage(self.channel)
+
+
+class LoadStats:
+    def __init__(self) -> None:
+        self.latency = defaultdict(list)
+        self.ack = defaultdict(list)
+        self.unacknowledged = Counter()
+        self.late = Counter()
+        self.errors = defaultdict(Counter)
+
+    def record(self, handler, latency, ack_delay):
+        self.latency[handler].append(latency)
+        if ack_delay is None:
+            self.unacknowledged[handler] += 1
+            return
+
+        self.ack[handler].append(ack_delay)
+        if ack_delay > metrics.INTERACTION_DEADLINE:
+            self.late[handler] += 1
+
+    def report(self):
+        handlers = {}
+        for handler, samples in self.latency.items():
+            handlers[handler] = summarize(samples)
+            handlers[handler].update(
+                ack_p99_ms=summarize(self.ack[handler])['p99_ms'] if self.ack[handler] else None,
+                ack_max_ms=max(self.ack[handler]) * 1000 if self.ack[handler] else None,
+                late=self.late[handler],
+                unacknowledged=self.unacknowledged[handler],
+                errors=dict(self.errors[handler]),
+            )
+
+        # The bot's own lag histogram, its quantiles are bucket bounds
+        lag = metrics.loop_lag_seconds
+        return {
+            'handlers': handlers,
+            'loop_lag': {
+                'runs': lag.count(),
+                'p50_ms': (lag.quantile(0.5) or 0.0) * 1000,
+                'p99_ms': (lag.quantile(0.99) or 0.0) * 1000,
+                'blocked_ms': lag.total() * 1000,
+            },
+        }
+
+
+async def click(view, item, member, stats):
+    # Runs a button press the way discord.ui.View dispatches one
+    interaction = FakeInteraction(member, view.ctx, view.ctx.api_latency)
+    start = time.perf_counter()
+    try:
+        if await view.interaction_check(interaction):
+            await item.callback(interaction)
+    except Exception as error:
+        stats.errors[item.label][type(error).__name__] += 1
+    stats.record(item.label, time.perf_counter() - start, interaction.ack_delay)
+
+
+async def playGame(args, rng, stats):
+    players = [FakeMember("Player One"), FakeMember("Player Two")]
+    thread = FakeThread(FakeGuild(players), args.api_latency)
+
+    session = winston_bot.bot.sessions.create(thread.id, next(_ids))
+    session.thread = thread
+    session.player_one_member, session.player_two_member = players
+    await winston_bot.new_game(thread, session)
+
+    moves = 0
+    while session.draft.inProgress() and moves < args.max_moves:
+        moves += 1
+        view = await shownView(session)
+        member = session.current_player_member
+        move = rng.choice((view.take_button, view.pass_button))
+
+        clicks = [(move, member)]
+        if rng.random() < args.double_click_rate:
+            clicks.append((move, member))
+        if rng.random() < args.view_rate:
+            clicks.append((view.view_pile_button, member))
+        if rng.random() < args.view_rate:
+            clicks.append((view.view_pulls, rng.choice(players)))
+
+        await asyncio.gather(*(click(view, item, clicker, stats) for item, clicker in clicks))
+        await asyncio.sleep(rng.uniform(0, args.think_time))
+
+    # Let the last scheduled edits go out before counting them
+    await asyncio.sleep(session.updates.debounce * 2)
+    await winston_bot.bot.sessions.close(session.session_id)
+    return moves, thread.edits
+
+
+async def shownView(session, timeout=5.0):
+    # Players click the buttons of the status message, which the debounced status edit
+    # replaces after every move
+    deadline = time.perf_counter() + timeout
+    view = session.status_message.kwargs['view']
+    while view.version != session.version and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+        view = session.status_message.kwargs['view']
+    return view
+
+
+async def run(args):
+    stub = ScryfallStub(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+    )
+    base_url = await stub.start()
+    fetcher = card_fetcher.CardFetcher(base_url=base_url, rate_limiter=card_fetcher.TokenBucket(rate=args.rate))
+    card_store = card_cache.PersistentCardCache(os.path.join(os.getcwd(), 'cards.sqlite3'))
+    winston_bot.bot.sessions = SessionManager(
+        fetcher=fetcher, card_store=card_store, default_draft_file='draft_files/cube.txt'
+    )
+
+    stats = LoadStats()
+    monitor = asyncio.create_task(metrics.monitor_loop_lag(args.monitor_interval))
+    rng = random.Random(args.seed)
+
+    start = time.perf_counter()
+    games = await asyncio.gather(*(playGame(args, random.Random(rng.getrandbits(64)), stats) for _ in range(args.games)))
+    elapsed = time.perf_counter() - start
+
+    monitor.cancel()
+    await winston_bot.bot.sessions.closeAll()
+    await fetcher.close()
+    card_store.close()
+    await stub.close()
+
+    results = stats.report()
+    results.update(
+        games=args.games,
+        moves=sum(moves for moves, _ in games),
+        message_edits=sum(edits for _, edits in games),
+        stale_moves=sum(winston_bot.stale_moves.value(action=action.name) for action in Action),
+        seconds=elapsed,
+        stub=stub.stats(),
+    )
+    return results
+
+
+def formatReport(results):
+    results_text = (
+        f"{results['games']} games, {results['moves']} moves in {results['seconds']:.1f}s, "
+        f"{results.get('message_edits', 0)} message edits, {results.get('stale_moves', 0)} stale moves dropped, stub {results['stub']}\n"
+    )
+    for handler, result in results['handlers'].items():
+        results_text += (
+            f"{handler:<11} n={result['runs']:<6} p50 {result['p50_ms']:8.1f}ms  p99 {result['p99_ms']:8.1f}ms  "
+            f"ack p99 {result['ack_p99_ms'] or 0:8.1f}ms  late {result['late']}  "
+            f"unacknowledged {result['unacknowledged']}  errors {result['errors']}\n"
+        )
+
+    lag = results['loop_lag']
+    results_text += (
+        f"Event loop lag: n={lag['runs']}  p50<={lag['p50_ms']:.0f}ms  p99<={lag['p99_ms']:.0f}ms  "
+        f"total {lag['blocked_ms']:.0f}ms\n"
+    )
+    return results_text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drives the bot's button handlers for many concurrent games")
+    parser.add_argument("cube", nargs="?", default="draft_files/cube.txt")
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--max-moves", type=int, default=400)
+    parser.add_argument("--think-time", type=float, default=0.2, help="longest pause between moves in seconds")
+    parser.add_argument("--view-rate", type=float, default=0.5, help="chance of a View Pile/View Pulls click per move")
+    parser.add_argument("--double-click-rate", type=float, default=0.05)
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Discord API call time in seconds")
+    parser.add_argument("--latency", type=float, default=0.05, help="Scryfall stub response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, default=10, help="fetcher requests per second")
+    parser.add_argument("--monitor-interval", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=RESULTS_DIR)
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    cube = os.path.abspath(args.cube)
+
+    # Game logs, stored cubes and the card cache go to a scratch directory
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'draft_files'))
+    shutil.copy(cube, os.path.join(workdir, 'draft_files', 'cube.txt'))
+    revision = gitRevision()
+    os.chdir(workdir)
+
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'revision': revision, 'timestamp': datetime.now(timezone.utc).isoformat(), 'config': vars(args), 'results': results}
+    print(formatReport(results))
+    print(f"Saved to {saveResults(report, output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import card_cache
+import card_fetcher
+from benchmarks.scryfall_stub import ScryfallStub
+from draft_state import Action
+from winston import DraftPile, WinstonDraft
+
+RESULTS_DIR = 'benchmarks/results'
+
+
+def _percentile(samples, percent):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def summarize(samples, items=1, elapsed=None):
+    # Latencies in seconds, throughput in items per second of wall time
+    elapsed = elapsed if elapsed is not None else sum(samples)
+    return {
+        'runs': len(samples),
+        'p50_ms': _percentile(samples, 50) * 1000,
+        'p99_ms': _percentile(samples, 99) * 1000,
+        'mean_ms': statistics.fmean(samples) * 1000,
+        'throughput': items * len(samples) / elapsed if elapsed else float('inf'),
+    }
+
+
+def timeCalls(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def playRandomGame(draft, rng):
+    moves = 0
+    while draft.inProgress():
+        draft.applyAction(rng.choice((Action.TAKE, Action.PASS)))
+        moves += 1
+    return moves
+
+
+def benchCube(cube_path, repeat):
+    with open(cube_path) as infile:
+        lines = infile.read().splitlines()
+
+    cards = len(DraftPile.parseCube(lines))
+    return {
+        'parse_cube': summarize(timeCalls(lambda: DraftPile.parseCube(lines), repeat), items=cards),
+        'load_cube': summarize(timeCalls(lambda: DraftPile(cube_path), repeat), items=cards),
+    }
+
+
+def benchGames(cube_path, games, card_store):
+    # Game logic only: without a running loop nothing is fetched
+    draft = WinstonDraft(fetcher=card_fetcher.CardFetcher(), card_store=card_store)
+    rng = random.Random(0)
+
+    samples = []
+    moves = 0
+    for _ in range(games):
+        start = time.perf_counter()
+        draft.newGame(cube_path, seed=rng.getrandbits(64))
+        moves += playRandomGame(draft, rng)
+        samples.append(time.perf_counter() - start)
+
+    result = summarize(samples)
+    result['moves_per_second'] = moves / sum(samples)
+    return {'play_game': result}
+
+
+async def benchRendering(cube_path, games, card_store):
+    # Every card is already cached, so this measures building the markdown
+    with open(cube_path) as infile:
+        names = DraftPile.parseCube(infile)
+    memory_cache = card_cache.LRUCardCache(capacity=len(names))
+    memory_cache.update({name: {'name': name, 'scryfall_uri': 'https://scryfall.com'} for name in names})
+
+    draft = WinstonDraft(fetcher=card_fetcher.CardFetcher(), card_store=card_store, memory_cache=memory_cache)
+    rng = random.Random(1)
+    pile_samples = []
+    pull_samples = []
+    page_samples = []
+
+    for _ in range(games):
+        draft.newGame(cube_path, seed=rng.getrandbits(64))
+
+        while draft.inProgress():
+            draft.applyAction(rng.choice((Action.TAKE, Action.PASS)))
+
+            start = time.perf_counter()
+            await draft.displayPickPiles(incl_all_piles=True)
+            pile_samples.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await draft.displayPlayerPulls(draft.current_player.value)
+            pull_samples.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await draft.displayPullsPage(draft.current_player.value, page=0)
+            page_samples.append(time.perf_counter() - start)
+
+    await draft.close()
+    return {
+        'render_piles': summarize(pile_samples),
+        'render_pulls': summarize(pull_samples),
+        'render_pulls_page': summarize(page_samples),
+    }
+
+
+async def benchFetching(cube_path, stub_options, rate, concurrency):
+    with open(cube_path) as infile:
+        names = list(dict.fromkeys(DraftPile.parseCube(infile)))
+
+    stub = ScryfallStub(**stub_options)
+    base_url = await stub.start()
+    results = {}
+
+    # One request per card, `concurrency` at a time
+    fetcher = card_fetcher.CardFetcher(base_url=base_url, rate_limiter=card_fetcher.TokenBucket(rate=rate, capacity=concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def fetchOne(name):
+        async with semaphore:
+            start = time.perf_counter()
+            await fetcher.fetch_card(name, fuzzy=False)
+            samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*map(fetchOne, names))
+    results['fetch_card'] = summarize(samples, elapsed=time.perf_counter() - start)
+    results['fetch_card'].update(retries=fetcher.retries, throttled=fetcher.throttled)
+    await fetcher.close()
+
+    # The whole cube in collection batches, as a new game warms its cache
+    fetcher = card_fetcher.CardFetcher(base_url=base_url, rate_limiter=card_fetcher.TokenBucket(rate=rate))
+    samples = []
+    for _ in range(5):
+        start = time.perf_counter()
+        await fetcher.fetch_collection(names, fuzzy_fallback=False)
+        samples.append(time.perf_counter() - start)
+    results['fetch_collection'] = summarize(samples, items=len(names))
+    results['fetch_collection'].update(retries=fetcher.retries, throttled=fetcher.throttled)
+    await fetcher.close()
+
+    results['stub'] = stub.stats()
+    await stub.close()
+    return results
+
+
+def gitRevision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def saveResults(report, directory):
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    path = os.path.join(directory, f"{stamp}-{report['revision']}.json")
+    with open(path, 'w') as outfile:
+        json.dump(report, outfile, indent=2)
+    return path
+
+
+def previousResults(directory, exclude):
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.endswith('.json') and os.path.join(directory, name) != exclude
+    ) if os.path.isdir(directory) else []
+    if not paths:
+        return None
+
+    with open(paths[-1]) as infile:
+        return json.load(infile)
+
+
+def formatReport(report, previous=None):
+    results_text = f"Revision {report['revision']}, {report['timestamp']}\n"
+    for name, result in report['results'].items():
+        if 'p50_ms' not in result:
+            results_text += f"{name}: {result}\n"
+            continue
+
+        results_text += (
+            f"{name:<20} p50 {result['p50_ms']:9.3f}ms  p99 {result['p99_ms']:9.3f}ms  "
+            f"{result['throughput']:12,.1f}/s"
+        )
+        before = previous['results'].get(name) if previous else None
+        if before and before.get('p50_ms'):
+            results_text += f"  p50 {result['p50_ms'] / before['p50_ms'] - 1:+.0%} vs {previous['revision']}"
+        results_text += "\n"
+
+    return results_text
+
+
+async def run(args):
+    card_store = card_cache.PersistentCardCache(os.path.join(tempfile.mkdtemp(), 'cards.sqlite3'))
+    results = {}
+
+    results.update(benchCube(args.cube, args.repeat))
+    results.update(await asyncio.to_thread(benchGames, args.cube, args.games, card_store))
+    results.update(await benchRendering(args.cube, args.games, card_store))
+    if not args.skip_fetch:
+        results.update(await benchFetching(
+            args.cube,
+            dict(
+                latency=args.latency,
+                jitter=args.jitter,
+                error_rate=args.error_rate,
+                throttle_rate=args.throttle_rate,
+                retry_after=args.retry_after,
+            ),
+            args.rate,
+            args.concurrency,
+        ))
+
+    card_store.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for cube loading, game play, rendering and card fetching")
+    parser.add_argument("cube", nargs="?", default="draft_files/cube.txt")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.1)
+    parser.add_argument("--rate", type=float, default=1000, help="fetcher requests per second")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--skip-fetch", action="store_true")
+    parser.add_argument("--output", default=RESULTS_DIR)
+    args = parser.parse_args()
+
+    report = {
+        'revision': gitRevision(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'config': vars(args),
+        'results': asyncio.run(run(args)),
+    }
+    path = saveResults(report, args.output)
+
+    print(formatReport(report, previousResults(args.output, exclude=path)))
+    print(f"Saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import asyncio
+import random
+
+from aiohttp import web
+
+
+class ScryfallStub:
+    # Local stand-in for the two Scryfall endpoints card_fetcher uses, /cards/named and
+    # /cards/collection. Every response waits `latency` seconds (plus up to `jitter`),
+    # and a share of requests fail with a 503 or get throttled with a 429.
+
+    def __init__(
+        self,
+        latency=0.05,
+        jitter=0.0,
+        error_rate=0.0,
+        throttle_rate=0.0,
+        retry_after=0.1,
+        not_found=(),
+        seed=0,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.not_found = {name.lower() for name in not_found}
+
+        self._random = random.Random(seed)
+        self._runner = None
+
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def _card_json(self, name):
+        slug = name.lower().replace(' ', '-')
+        return {
+            'object': 'card',
+            'name': name,
+            'scryfall_uri': f'https://scryfall.com/card/stub/1/{slug}?utm_source=api',
+            'mana_cost': '{1}',
+            'type_line': 'Artifact',
+            'image_uris': {'normal': f'https://cards.scryfall.io/normal/front/{slug}.jpg'},
+        }
+
+    async def _respond(self):
+        # Returns an error response to send instead of the real one, or None
+        self.requests += 1
+        await asyncio.sleep(self.latency + self._random.random() * self.jitter)
+
+        if self._random.random() < self.throttle_rate:
+            self.throttled += 1
+            return web.json_response(
+                {'object': 'error', 'status': 429}, status=429, headers={'Retry-After': str(self.retry_after)}
+            )
+        if self._random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503)
+
+        return None
+
+    async def named(self, request):
+        error = await self._respond()
+        if error is not None:
+            return error
+
+        name = request.query.get('exact') or request.query.get('fuzzy') or ''
+        if not name or name.lower() in self.not_found:
+            return web.json_response({'object': 'error', 'status': 404}, status=404)
+
+        return web.json_response(self._card_json(name))
+
+    async def collection(self, request):
+        error = await self._respond()
+        if error is not None:
+            return error
+
+        identifiers = (await request.json())['identifiers']
+        data = [self._card_json(identifier['name']) for identifier in identifiers if identifier['name'].lower() not in self.not_found]
+        not_found = [identifier for identifier in identifiers if identifier['name'].lower() in self.not_found]
+        return web.json_response({'object': 'list', 'data': data, 'not_found': not_found})
+
+    async def start(self, host='127.0.0.1', port=0):
+        # Returns the base url to point a CardFetcher at, port 0 picks a free port
+        app = web.Application()
+        app.router.add_get('/cards/named', self.named)
+        app.router.add_post('/cards/collection', self.collection)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+        host, port = self._runner.addresses[0][:2]
+        return f'http://{host}:{port}'
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self):
+        return {'requests': self.requests, 'errors': self.errors, 'throttled': self.throttled}
@@ -0,0 +1,236 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+DEFAULT_CACHE_PATH = 'draft_files/card_cache.sqlite3'
+DEFAULT_TTL = timedelta(days=7).total_seconds()
+DEFAULT_CAPACITY = 2048
+DEFAULT_NEGATIVE_TTL = timedelta(minutes=5).total_seconds()
+
+# Returned by lookups that found nothing, since None is a valid cached "card not found" result
+MISSING = object()
+
+# Only the fields we actually render are persisted, not the full Scryfall blob
+CARD_FIELDS = ('name', 'scryfall_uri', 'mana_cost', 'type_line', 'image_uris')
+
+
+def slim_card(card_json):
+    if not card_json:
+        return None
+
+    card = {field: card_json.get(field) for field in CARD_FIELDS}
+
+    # Double faced cards keep these on their faces instead of the card itself
+    faces = card_json.get('card_faces') or []
+    if faces:
+        if card['mana_cost'] is None:
+            card['mana_cost'] = ' // '.join(face.get('mana_cost', '') for face in faces)
+        if card['image_uris'] is None:
+            card['image_uris'] = faces[0].get('image_uris')
+
+    return card
+
+
+class LRUCardCache:
+    # In-memory card cache bounded to a fixed number of entries, least recently used go first.
+    # Lookups that came back empty are cached as None for a short time so a bad name
+    # isn't fetched again on every render.
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, negative_ttl=DEFAULT_NEGATIVE_TTL) -> None:
+        self.capacity = capacity
+        self.negative_ttl = negative_ttl
+
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dedups = 0
+
+    def _lookup(self, name):
+        entry = self._entries.get(name)
+        if entry is None:
+            return MISSING
+
+        card, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._entries[name]
+            return MISSING
+
+        self._entries.move_to_end(name)
+        return card
+
+    def get(self, name, default=None):
+        card = self._lookup(name)
+        if card is MISSING:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        return card
+
+    def peek(self, name, default=None):
+        # Same as get without touching the hit/miss counters
+        card = self._lookup(name)
+        return default if card is MISSING else card
+
+    def put(self, name, card):
+        if not name:
+            return
+
+        expires_at = time.monotonic() + self.negative_ttl if card is None else None
+        self._entries[name] = (card, expires_at)
+        self._entries.move_to_end(name)
+
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def update(self, cards):
+        for name, card in cards.items():
+            self.put(name, card)
+
+    def record_dedup(self):
+        self.dedups += 1
+
+    def __contains__(self, name):
+        return self.peek(name, MISSING) is not MISSING
+
+    def __getitem__(self, name):
+        card = self.get(name, MISSING)
+        if card is MISSING:
+            raise KeyError(name)
+        return card
+
+    def __setitem__(self, name, card):
+        self.put(name, card)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'dedups': self.dedups,
+        }
+
+
+class PersistentCardCache:
+    # SQLite backed card store shared across games and restarts.
+    # The database is only opened on first use and rows are read on demand,
+    # so startup cost does not grow with the size of the cache.
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL) -> None:
+        self.path = path
+        self.ttl = ttl
+
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS cards ('
+                'name TEXT PRIMARY KEY, card TEXT NOT NULL, fetched_at REAL NOT NULL)'
+            )
+            self._connection.commit()
+
+        return self._connection
+
+    def _is_fresh(self, fetched_at):
+        return self.ttl is None or time.time() - fetched_at < self.ttl
+
+    def get(self, name):
+        return self.get_many([name]).get(name)
+
+    def get_many(self, names):
+        # Returns {name: card} for every fresh entry, stale and unknown names are left out
+        return {name: card for name, (card, _) in self.get_many_fetched(names).items()}
+
+    def get_many_fetched(self, names):
+        # Like get_many, with the time each card was fetched: {name: (card, fetched_at)}
+        names = list(dict.fromkeys(name for name in names if name))
+        cards = {}
+
+        with self._lock:
+            connection = self._connect()
+            # Stay under SQLite's default bound parameter limit
+            for start in range(0, len(names), 500):
+                batch = names[start:start + 500]
+                rows = connection.execute(
+                    f'SELECT name, card, fetched_at FROM cards WHERE name IN ({",".join("?" * len(batch))})',
+                    batch,
+                )
+                for name, card, fetched_at in rows:
+                    if self._is_fresh(fetched_at):
+                        cards[name] = (json.loads(card), fetched_at)
+
+        return cards
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def put(self, name, card_json):
+        self.put_many({name: card_json})
+
+    def put_many(self, cards):
+        now = time.time()
+        rows = [
+            (name, json.dumps(slim_card(card_json)), now)
+            for name, card_json in cards.items()
+            if name and card_json
+        ]
+        if not rows:
+            return
+
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                'INSERT OR REPLACE INTO cards (name, card, fetched_at) VALUES (?, ?, ?)', rows
+            )
+            connection.commit()
+
+    def purge_stale(self):
+        if self.ttl is None:
+            return
+
+        with self._lock:
+            connection = self._connect()
+            connection.execute('DELETE FROM cards WHERE fetched_at < ?', (time.time() - self.ttl,))
+            connection.commit()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+_shared_store = None
+
+
+def get_card_store():
+    global _shared_store
+    if _shared_store is None:
+        _shared_store = PersistentCardCache()
+    return _shared_store
+
+
+def close_card_store():
+    global _shared_store
+    if _shared_store is not None:
+        _shared_store.close()
+        _shared_store = None
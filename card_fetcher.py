@@ -1,42 +1,446 @@
 import aiohttp
 import asyncio
+import itertools
+import logging
+import random
 import time
-from datetime import timedelta
-from ratelimit import limits, sleep_and_retry
 from urllib import parse
 
-@sleep_and_retry
-@limits(calls=1, period=timedelta(milliseconds=100).total_seconds())
-async def fetch_card(name: str, fuzzy: bool):
-    # Example call:
-    # https://api.scryfall.com/cards/named?set=&fuzzy=Black+Lotus&format=json&face=&version=&pretty=
-    
-    search_type = 'fuzzy' if fuzzy else 'exact'
-
-    params = {
-        search_type: name,
-        'format': 'json',
-        'face': '',
-        'version': '',
-        'pretty': ''
-    }
-
-    url_args = parse.urlencode(params)
-
-    url = f'https://api.scryfall.com/cards/named?{url_args}'
-
-    card_json = None
-    async with aiohttp.ClientSession() as client:
-        async with client.get(url) as response:
-            print(f'{time.time()} Call to scryfall for card: {name}')
-            card_json = await response.json()
-
-    if not card_json:
-        return None
-    if card_json['object'] == 'error':
+import metrics
+
+SCRYFALL_API_URL = 'https://api.scryfall.com'
+COLLECTION_BATCH_SIZE = 75
+
+# Scryfall asks for 50-100ms between requests, roughly 10 per second
+SCRYFALL_REQUESTS_PER_SECOND = 10
+
+logger = logging.getLogger(__name__)
+
+request_seconds = metrics.histogram('scryfall_request_seconds', 'Scryfall request time per attempt', ('endpoint',))
+responses = metrics.counter('scryfall_responses_total', 'Scryfall responses by status', ('endpoint', 'status'))
+fetch_seconds = metrics.histogram('scryfall_fetch_seconds', 'Scryfall lookup time including rate limiting and retries', ('endpoint',))
+rate_limit_wait_seconds = metrics.histogram('scryfall_rate_limit_wait_seconds', 'Time spent waiting on the rate limiter')
+
+
+class CardLookupError(Exception):
+    # Scryfall couldn't be asked about some cards, which says nothing about whether they exist
+    pass
+
+
+class TokenBucket:
+    # Async rate limiter shared by every request a fetcher makes.
+    # Waiting callers sleep on the loop instead of blocking it, and a 429 from the server
+    # empties the bucket until its Retry-After has passed.
+
+    def __init__(self, rate=SCRYFALL_REQUESTS_PER_SECOND, capacity=1) -> None:
+        self.rate = rate
+        self.capacity = capacity
+
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+        self.acquired = 0
+        self.delayed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        # Returns how many seconds the caller waited for its token
+        start = time.monotonic()
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+        waited = time.monotonic() - start
+        rate_limit_wait_seconds.observe(waited)
+        self.acquired += 1
+        if waited > 0.001:
+            self.delayed += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+        return waited
+
+    def block_for(self, seconds):
+        now = time.monotonic()
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        self._tokens = 0
+        self._updated = now
+
+    def stats(self):
+        return {
+            'acquired': self.acquired,
+            'delayed': self.delayed,
+            'total_wait': self.total_wait,
+            'average_wait': self.total_wait / self.acquired if self.acquired else 0.0,
+            'max_wait': self.max_wait,
+        }
+
+
+class CardFetcher:
+    # Owns a single pooled aiohttp session so every card lookup reuses the same
+    # keep-alive connections to Scryfall instead of a new TCP+TLS handshake each time.
+    # The session is created lazily on the loop that first uses it (the bot's loop).
+
+    def __init__(
+        self,
+        connection_limit=8,
+        keepalive_timeout=30,
+        base_url=SCRYFALL_API_URL,
+        rate_limiter=None,
+        max_retries=3,
+        backoff_base=0.5,
+        backoff_cap=8.0,
+        index=None,
+        offline=False,
+    ) -> None:
+        self.connection_limit = connection_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter if rate_limiter else TokenBucket()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        # Optional card_index.CardIndex consulted before Scryfall, offline never falls through to the API
+        self.index = index
+        self.offline = offline
+
+        self._session = None
+        self.throttled = 0
+        self.retries = 0
+
+        # Single-flight: concurrent lookups of the same card share one request
+        self._in_flight = {}
+        self.coalesced = 0
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+
+        return self._session
+
+    def _backoff(self, attempt):
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _retry_after(response, default):
+        try:
+            return max(0.0, float(response.headers.get('Retry-After', default)))
+        except ValueError:
+            return default
+
+    async def _request(self, method, url, **kwargs):
+        # Rate limited request that honours 429/Retry-After and retries server errors,
+        # returns the decoded json body or None
+        endpoint = parse.urlsplit(url).path
+        with fetch_seconds.time(endpoint=endpoint):
+            return await self._request_with_retries(endpoint, method, url, **kwargs)
+
+    async def _request_with_retries(self, endpoint, method, url, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+
+            status = 'error'
+            start = time.perf_counter()
+            try:
+                async with self._get_session().request(method, url, **kwargs) as response:
+                    status = response.status
+                    if response.status == 429:
+                        self.throttled += 1
+                        self.rate_limiter.block_for(self._retry_after(response, self._backoff(attempt) + 1))
+                        continue
+
+                    if response.status < 500:
+                        return await response.json(content_type=None)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                pass
+            finally:
+                request_seconds.observe(time.perf_counter() - start, endpoint=endpoint)
+                responses.inc(endpoint=endpoint, status=status)
+
+            if attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+
         return None
-    
-    return card_json
+
+    @staticmethod
+    def _flight_key(name, fuzzy):
+        return (name.lower(), fuzzy)
+
+    async def fetch_card(self, name: str, fuzzy: bool):
+        if self.index is not None:
+            # SQLite reads block and fuzzy matching may scan every name, keep both off the loop
+            card_json = await asyncio.to_thread(self.index.fuzzy if fuzzy else self.index.exact, name)
+            if card_json or self.offline:
+                return card_json
+
+        key = self._flight_key(name, fuzzy)
+        flight = self._in_flight.get(key)
+
+        if flight is None:
+            flight = asyncio.ensure_future(self._fetch_card(name, fuzzy))
+            self._in_flight[key] = flight
+            flight.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # Shielded so one caller giving up doesn't cancel the lookup for everyone else
+        return await asyncio.shield(flight)
+
+    async def _fetch_card(self, name: str, fuzzy: bool):
+        # Example call:
+        # https://api.scryfall.com/cards/named?set=&fuzzy=Black+Lotus&format=json&face=&version=&pretty=
+
+        search_type = 'fuzzy' if fuzzy else 'exact'
+
+        params = {
+            search_type: name,
+            'format': 'json',
+            'face': '',
+            'version': '',
+            'pretty': ''
+        }
+
+        url_args = parse.urlencode(params)
+
+        url = f'{self.base_url}/cards/named?{url_args}'
+
+        logger.debug('Call to scryfall for card: %s', name)
+        card_json = await self._request('GET', url)
+
+        if not card_json:
+            return None
+        if card_json['object'] == 'error':
+            return None
+
+        return card_json
+
+    async def _fetch_collection_batch(self, names):
+        # https://scryfall.com/docs/api/cards/collection accepts at most 75 identifiers per request,
+        # returns the cards found or None when the request failed
+        payload = {'identifiers': [{'name': name} for name in names]}
+
+        logger.debug('Call to scryfall for %d card collection', len(names))
+        collection_json = await self._request('POST', f'{self.base_url}/cards/collection', json=payload)
+
+        if not collection_json or collection_json['object'] == 'error':
+            return None
+
+        return collection_json.get('data', [])
+
+    async def fetch_collection(self, names, fuzzy_fallback=True):
+        # Resolve many names in as few requests as possible, returns {name: card_json or None}.
+        # Names in a batch whose request failed are left out, they may well exist, and
+        # aren't looked up one by one either so an outage doesn't multiply the requests.
+        unique_names = list(dict.fromkeys(name for name in names if name))
+        cards = {}
+
+        if self.index is not None:
+            cards.update(await asyncio.to_thread(self.index.exact_many, unique_names))
+            unique_names = [name for name in unique_names if name not in cards]
+
+            if self.offline:
+                for name in unique_names:
+                    cards[name] = await self.fetch_card(name, fuzzy=True) if fuzzy_fallback else None
+                return cards
+
+        # Names already being looked up join that request, the rest are claimed by this call
+        # so exact lookups arriving while the batch is out wait on it instead
+        joined = {}
+        claimed = {}
+        loop = asyncio.get_running_loop()
+        for name in unique_names:
+            key = self._flight_key(name, False)
+            if key in self._in_flight:
+                joined[name] = self._in_flight[key]
+                self.coalesced += 1
+            else:
+                claimed[name] = self._in_flight[key] = loop.create_future()
+
+        def settle(name, card_json, resolved=True):
+            if resolved:
+                cards[name] = card_json
+            flight = claimed[name]
+            if not flight.done():
+                flight.set_result(card_json)
+            self._in_flight.pop(self._flight_key(name, False), None)
+
+        try:
+            claimed_names = list(claimed)
+            misses = []
+            for start in range(0, len(claimed_names), COLLECTION_BATCH_SIZE):
+                batch = claimed_names[start:start + COLLECTION_BATCH_SIZE]
+                batch_json = await self._fetch_collection_batch(batch)
+                if batch_json is None:
+                    for name in batch:
+                        settle(name, None, resolved=False)
+                    continue
+
+                found = {}
+                for card_json in batch_json:
+                    found[card_json['name'].lower()] = card_json
+                    # Double faced cards are returned under their full 'Front // Back' name
+                    for face_name in card_json['name'].split(' // '):
+                        found.setdefault(face_name.lower(), card_json)
+
+                for name in batch:
+                    card_json = found.get(name.lower())
+                    if card_json is None and fuzzy_fallback:
+                        misses.append(name)
+                    else:
+                        settle(name, card_json)
+
+            for name in misses:
+                settle(name, await self.fetch_card(name, fuzzy=True))
+        finally:
+            for name, flight in claimed.items():
+                if not flight.done():
+                    settle(name, None)
+
+        for name, flight in joined.items():
+            cards[name] = await asyncio.shield(flight)
+
+        return cards
+
+    async def suggest_names(self, name, count=3):
+        # Likely intended card names for a name that didn't resolve
+        if self.index is not None:
+            suggestions = await asyncio.to_thread(self.index.suggest, name, count)
+            if suggestions or self.offline:
+                return suggestions
+
+        card_json = await self.fetch_card(name, fuzzy=True)
+        return [card_json['name']] if card_json else []
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class CardPrefetcher:
+    # Resolves cards in the background on the running loop.
+    # Requests wait in a bounded priority queue (lowest first) and are worked off by a
+    # fixed number of tasks, callers await the same future instead of blocking on a thread.
+
+    def __init__(self, resolve, max_pending=128, concurrency=4) -> None:
+        self.resolve = resolve
+        self.max_pending = max_pending
+        self.concurrency = concurrency
+
+        self._queue = None
+        self._pending = {}
+        self._workers = []
+        self._order = itertools.count()
+
+    def _start(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue(maxsize=self.max_pending)
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    def is_pending(self, name):
+        return name in self._pending
+
+    def prefetch(self, name, priority=0):
+        # Best effort hint, dropped when there is no running loop or the queue is full
+        if not name or name in self._pending:
+            return
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        self._start()
+        if self._queue.full():
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[name] = future
+        # Equal priorities are worked off in the order they were requested
+        self._queue.put_nowait((priority, next(self._order), name, future))
+
+    async def get(self, name):
+        if name in self._pending:
+            return await asyncio.shield(self._pending[name])
+
+        return await self.resolve(name)
+
+    async def _work(self):
+        while True:
+            _, _, name, future = await self._queue.get()
+            try:
+                result = await self.resolve(name)
+            except Exception:
+                result = None
+            finally:
+                self._pending.pop(name, None)
+                self._queue.task_done()
+
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+        for future in self._pending.values():
+            future.cancel()
+
+        self._queue = None
+        self._pending = {}
+        self._workers = []
+
+
+_shared_fetcher = None
+
+
+def get_fetcher():
+    global _shared_fetcher
+    if _shared_fetcher is None:
+        _shared_fetcher = CardFetcher()
+    return _shared_fetcher
+
+
+async def close_fetcher():
+    global _shared_fetcher
+    if _shared_fetcher is not None:
+        await _shared_fetcher.close()
+        _shared_fetcher = None
+
 
 def quick_fetch(name: str, fuzzy: bool):
-    return asyncio.run(fetch_card(name, fuzzy))
\ No newline at end of file
+    # One-off lookup for scripts without a running loop
+    async def fetch():
+        fetcher = CardFetcher()
+        try:
+            return await fetcher.fetch_card(name, fuzzy)
+        finally:
+            await fetcher.close()
+
+    return asyncio.run(fetch())
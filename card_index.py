@@ -0,0 +1,214 @@
+import difflib
+import json
+import re
+import sqlite3
+import sys
+import threading
+import unicodedata
+
+import card_cache
+
+DEFAULT_INDEX_PATH = 'draft_files/card_index.sqlite3'
+
+_READ_SIZE = 1 << 20
+_SEPARATORS = '[], \t\r\n'
+
+# Bulk-data objects that aren't cards anyone drafts, they share names with the real ones
+NON_GAME_LAYOUTS = frozenset(('token', 'double_faced_token', 'emblem', 'art_series'))
+
+# A card's full name outranks the face name of another card under the same key
+_FULL_NAME = 0
+_FACE_NAME = 1
+
+
+def normalize_name(name):
+    # Case, accent and punctuation insensitive key: "Lim-Dûl's Vault" -> "lim duls vault"
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(char for char in name if not unicodedata.combining(char))
+    name = re.sub(r"['’]", '', name.lower())
+    name = re.sub(r'[^a-z0-9/]+', ' ', name)
+    return ' '.join(name.split())
+
+
+def iter_bulk_cards(file_path):
+    # Streams the objects out of a Scryfall bulk-data file (one big JSON array)
+    # without holding the whole file in memory
+    decoder = json.JSONDecoder()
+    buffer = ''
+
+    with open(file_path, encoding='utf-8') as infile:
+        for chunk in iter(lambda: infile.read(_READ_SIZE), ''):
+            buffer += chunk
+            position = 0
+            while True:
+                while position < len(buffer) and buffer[position] in _SEPARATORS:
+                    position += 1
+                if position >= len(buffer):
+                    break
+
+                try:
+                    card_json, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # Object continues in the next chunk
+                    break
+
+                yield card_json
+
+            buffer = buffer[position:]
+
+    if buffer.strip(_SEPARATORS):
+        raise ValueError(f'Truncated bulk data file: {file_path}')
+
+
+class CardIndex:
+    # Local SQLite card database built from a Scryfall bulk-data dump (oracle-cards).
+    # Keyed by normalized name, with each face of a multi-faced card indexed as well.
+    # A key that is both a card's full name and a face of another card finds the card.
+
+    def __init__(self, path=DEFAULT_INDEX_PATH) -> None:
+        self.path = path
+
+        self._connection = None
+        self._names = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._create_table(self._connection)
+
+        return self._connection
+
+    @staticmethod
+    def _create_table(connection):
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS cards ('
+            'key TEXT PRIMARY KEY, name TEXT NOT NULL, card TEXT NOT NULL, rank INTEGER NOT NULL DEFAULT 0)'
+        )
+
+    def build(self, bulk_file_path, batch_size=5000):
+        # Replaces the index contents with the cards from a bulk-data file, returns the card count
+        count = 0
+        rows = []
+
+        # Between two cards with the same key, a full name replaces a face name, otherwise
+        # the first one in the file is kept
+        insert = (
+            'INSERT INTO cards VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+            'name = excluded.name, card = excluded.card, rank = excluded.rank WHERE excluded.rank < cards.rank'
+        )
+
+        with self._lock:
+            connection = self._connect()
+            # Recreated rather than emptied, so indexes built before the rank column get it
+            connection.execute('DROP TABLE cards')
+            self._create_table(connection)
+
+            for card_json in iter_bulk_cards(bulk_file_path):
+                if card_json.get('object') != 'card' or not card_json.get('name'):
+                    continue
+                if card_json.get('layout') in NON_GAME_LAYOUTS:
+                    continue
+
+                card = json.dumps(card_cache.slim_card(card_json))
+                name = card_json['name']
+                full_key = normalize_name(name)
+                rows.append((full_key, name, card, _FULL_NAME))
+                for key in dict.fromkeys(normalize_name(face) for face in name.split(' // ')):
+                    if key != full_key:
+                        rows.append((key, name, card, _FACE_NAME))
+                count += 1
+
+                if len(rows) >= batch_size:
+                    connection.executemany(insert, rows)
+                    rows = []
+
+            connection.executemany(insert, rows)
+            connection.commit()
+            self._names = None
+
+        return count
+
+    def _load_names(self):
+        # Every key, loaded on the first fuzzy lookup that needs a spelling match
+        if self._names is None:
+            with self._lock:
+                self._names = [row[0] for row in self._connect().execute('SELECT key FROM cards')]
+
+        return self._names
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute('SELECT COUNT(DISTINCT name) FROM cards').fetchone()[0]
+
+    def exact(self, name):
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT card FROM cards WHERE key = ?', (normalize_name(name),)
+            ).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def exact_many(self, names):
+        # Returns {name: card} for the names found, missing names are left out
+        keys = {}
+        for name in dict.fromkeys(name for name in names if name):
+            keys.setdefault(normalize_name(name), []).append(name)
+
+        cards = {}
+        key_list = list(keys)
+        with self._lock:
+            connection = self._connect()
+            for start in range(0, len(key_list), 500):
+                batch = key_list[start:start + 500]
+                rows = connection.execute(
+                    f'SELECT key, card FROM cards WHERE key IN ({",".join("?" * len(batch))})', batch
+                )
+                for key, card in rows:
+                    card = json.loads(card)
+                    for name in keys[key]:
+                        cards[name] = card
+
+        return cards
+
+    def fuzzy(self, name, cutoff=0.75):
+        # Mirrors Scryfall's fuzzy search closely enough for typos and partial names:
+        # exact key, then a unique prefix match, then the closest spelling
+        card = self.exact(name)
+        if card:
+            return card
+
+        key = normalize_name(name)
+        if not key:
+            return None
+
+        with self._lock:
+            connection = self._connect()
+            rows = connection.execute(
+                'SELECT DISTINCT name, card FROM cards WHERE key >= ? AND key < ? LIMIT 2',
+                (key, key + '\uffff'),
+            ).fetchall()
+
+            if len(rows) == 1:
+                return json.loads(rows[0][1])
+
+        matches = difflib.get_close_matches(key, self._load_names(), n=1, cutoff=cutoff)
+        return self.exact(matches[0]) if matches else None
+
+    def suggest(self, name, count=3, cutoff=0.6):
+        # Closest known card names, for reporting typos back to the user
+        keys = difflib.get_close_matches(normalize_name(name), self._load_names(), n=count, cutoff=cutoff)
+        return list(dict.fromkeys(card['name'] for card in map(self.exact, keys) if card))
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+if __name__ == '__main__':
+    # Usage: python card_index.py oracle-cards.json [index path]
+    index = CardIndex(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_INDEX_PATH)
+    print(f'Indexed {index.build(sys.argv[1])} cards into {index.path}')
+    index.close()
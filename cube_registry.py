@@ -0,0 +1,231 @@
+import hashlib
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+DEFAULT_CUBE_DIR = 'draft_files/cubes'
+DEFAULT_CAPACITY = 64
+
+# Typecode for card id arrays, allows up to 65536 distinct cards per cube
+CARD_ID_TYPE = 'H'
+
+# Most copies of one card a line of a list may ask for
+MAX_QUANTITY = 100
+
+
+class CubeListError(ValueError):
+    # A cube list with lines that can't be read, `lines` holds (line number, line) pairs
+
+    def __init__(self, lines) -> None:
+        super().__init__('Malformed cube list lines: ' + ', '.join(str(number) for number, _ in lines))
+        self.lines = lines
+
+
+def parseCube(lines):
+    # "[quantity] name" per line, the list ends at the first blank line
+    cube = []
+    malformed = []
+
+    for number, line in enumerate(lines, start=1):
+
+        if not line.strip():
+            break
+
+        values = line.split(maxsplit=1)
+        quantity = 0
+        name = ""
+        if not values[0].isnumeric():
+            quantity = 1
+            name = ' '.join(values).strip()
+        elif len(values) < 2 or not 1 <= int(values[0]) <= MAX_QUANTITY:
+            malformed.append((number, line.strip()))
+            continue
+        else:
+            quantity = int(values[0])
+            name = values[1].strip()
+
+        for i in range(quantity):
+            cube.append(name)
+
+    if malformed:
+        raise CubeListError(malformed)
+
+    return cube
+
+
+def cubeHash(cube_text):
+    return hashlib.sha256(cube_text.encode('utf-8')).hexdigest()
+
+
+class CardTable:
+    # Per cube symbol table, game state holds small integer ids and names are
+    # only looked up when rendering
+
+    __slots__ = ("names", "ids")
+
+    def __init__(self, names=()) -> None:
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.intern(name)
+
+    def intern(self, name):
+        card_id = self.ids.get(name)
+        if card_id is None:
+            card_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return card_id
+
+    def internAll(self, names):
+        return array(CARD_ID_TYPE, map(self.intern, names))
+
+    def name(self, card_id):
+        return self.names[card_id]
+
+    def namesOf(self, card_ids):
+        return [self.names[card_id] for card_id in card_ids]
+
+    def __len__(self):
+        return len(self.names)
+
+
+class Cube:
+    # A cube list parsed once: its card table and one id per card copy in list order.
+    # Games share it read-only and shuffle their own copy of the ids. `bundle` collects
+    # the resolved card of each name with the time it was fetched as games on the cube
+    # find them, so later games start without touching the card store.
+
+    __slots__ = ("cube_hash", "cards", "card_ids", "bundle")
+
+    def __init__(self, cube_text) -> None:
+        self.cube_hash = cubeHash(cube_text)
+        self.cards = CardTable()
+        self.card_ids = bytes(self.cards.internAll(parseCube(cube_text.splitlines())))
+        self.bundle = {}
+
+    def ids(self):
+        return array(CARD_ID_TYPE, self.card_ids)
+
+    def bundled(self, names, ttl=None):
+        # Bundled cards among `names` fetched less than `ttl` seconds ago, older ones are dropped
+        cards = {}
+        now = time.time()
+        for name in names:
+            entry = self.bundle.get(name)
+            if entry is None:
+                continue
+            card, fetched_at = entry
+            if ttl is None or now - fetched_at < ttl:
+                cards[name] = card
+            else:
+                del self.bundle[name]
+        return cards
+
+    def uniqueNames(self):
+        return self.cards.names
+
+    def __len__(self):
+        return len(self.card_ids) // array(CARD_ID_TYPE).itemsize
+
+
+class CubeRegistry:
+    # Cubes by content hash. Every registered list is written once to
+    # `directory`/<hash>.txt, so two uploads can't overwrite each other and a logged
+    # game can always find its cube again. Parsed cubes are kept for the most
+    # recently used `capacity` hashes.
+
+    def __init__(self, directory=DEFAULT_CUBE_DIR, capacity=DEFAULT_CAPACITY) -> None:
+        self.directory = directory
+        self.capacity = capacity
+
+        self._cubes = OrderedDict()
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def path(self, cube_hash):
+        return os.path.join(self.directory, f'{cube_hash}.txt')
+
+    def _remember(self, cube):
+        with self._lock:
+            cube = self._cubes.setdefault(cube.cube_hash, cube)
+            self._cubes.move_to_end(cube.cube_hash)
+            while len(self._cubes) > self.capacity:
+                self._cubes.popitem(last=False)
+        return cube
+
+    def register(self, cube_text):
+        cube_hash = cubeHash(cube_text)
+        with self._lock:
+            cube = self._cubes.get(cube_hash)
+        if cube is not None:
+            return self._remember(cube)
+
+        path = self.path(cube_hash)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as outfile:
+                outfile.write(cube_text)
+            os.replace(temp_path, path)
+
+        return self._remember(Cube(cube_text))
+
+    def load(self, file_path):
+        # Cube list on disk, only read again once the file changes
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        cube_hash = self._files.get(key)
+        if cube_hash is not None:
+            with self._lock:
+                cube = self._cubes.get(cube_hash)
+            if cube is not None:
+                return self._remember(cube)
+
+        with open(file_path, encoding='utf-8') as infile:
+            cube = self.register(infile.read())
+        self._files[key] = cube.cube_hash
+        return cube
+
+    def get(self, cube_hash):
+        with self._lock:
+            cube = self._cubes.get(cube_hash)
+        if cube is not None:
+            return self._remember(cube)
+
+        with open(self.path(cube_hash), encoding='utf-8') as infile:
+            return self.register(infile.read())
+
+    def prune(self, keep=()):
+        # Deletes the cube files that aren't in `keep` or parsed in memory, returns how many
+        if not os.path.isdir(self.directory):
+            return 0
+
+        with self._lock:
+            keep = set(keep).union(self._cubes)
+
+        pruned = 0
+        for name in os.listdir(self.directory):
+            cube_hash, extension = os.path.splitext(name)
+            if extension != '.txt' or cube_hash in keep:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            pruned += 1
+        return pruned
+
+    def __len__(self):
+        return len(self._cubes)
+
+
+_shared_registry = None
+
+
+def get_registry():
+    global _shared_registry
+    if _shared_registry is None:
+        _shared_registry = CubeRegistry()
+    return _shared_registry
@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import timedelta
+
+import card_cache
+import card_fetcher
+import cube_registry
+import game_log
+import status_updates
+from winston import DEFAULT_LOOKAHEAD, WinstonDraft
+
+DEFAULT_IDLE_TIMEOUT = timedelta(hours=2).total_seconds()
+
+logger = logging.getLogger(__name__)
+
+
+class QueueClosed(RuntimeError):
+    pass
+
+
+class TaskQueue:
+    # Runs one session's interaction work a job at a time in the order it arrived.
+    # Every session has its own worker, so a slow job only holds up its own game.
+    # Once closed it takes no more jobs.
+
+    def __init__(self) -> None:
+        self._jobs = asyncio.Queue()
+        self._worker = None
+        self.closed = False
+
+    def submit(self, job):
+        # `job` is an async callable, returns a future of its result
+        if self.closed:
+            raise QueueClosed('Task queue is closed')
+
+        future = asyncio.get_running_loop().create_future()
+        self._jobs.put_nowait((job, future))
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        return future
+
+    async def _run(self):
+        while True:
+            job, future = await self._jobs.get()
+            if future.done():
+                continue
+
+            try:
+                result = await job()
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    def __len__(self):
+        return self._jobs.qsize()
+
+    async def close(self):
+        self.closed = True
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+
+        while not self._jobs.empty():
+            self._jobs.get_nowait()[1].cancel()
+
+
+class DraftSession:
+    # Everything one game needs on the Discord side: its draft, its players and the
+    # thread it is played in. Interactions on a session run one at a time on its
+    # task queue, moves are also serialized through its lock. `version` counts the
+    # moves made, a move is only applied to the version it was made against.
+
+    def __init__(
+        self,
+        session_id,
+        channel_id,
+        draft,
+        draft_file=None,
+        cubes=None,
+        status_debounce=status_updates.DEFAULT_DEBOUNCE,
+    ) -> None:
+        self.session_id = session_id
+        self.channel_id = channel_id
+        self.draft = draft
+        self.draft_file = draft_file
+        self.cubes = cubes if cubes else cube_registry.get_registry()
+        # Uploaded cube list, played instead of draft_file when set
+        self.cube = None
+
+        self.thread = None
+        self.player_one_member = None
+        self.player_two_member = None
+        self.current_player_member = None
+        self.last_action_message = None
+        self.status_message = None
+        self.status_messages = {}
+        self.updates = status_updates.UpdateScheduler(debounce=status_debounce)
+        # Ids of the messages the bot posted for this session by channel id, so cleanup
+        # deletes them directly instead of searching channel history
+        self.owned_messages = {}
+
+        self.game_started = False
+        self.lock = asyncio.Lock()
+        self.tasks = TaskQueue()
+        self.version = 0
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def idleFor(self):
+        return time.monotonic() - self.last_active
+
+    def startGame(self, log_dir=game_log.GAME_LOG_DIR):
+        # Deals from the registered cube and logs the game so it survives a restart
+        cube = self.cube if self.cube else self.cubes.load(self.draft_file)
+        self.draft.newGame(cube)
+        self.version += 1
+
+        header = {
+            'session_id': self.session_id,
+            'channel_id': self.channel_id,
+            'players': [self.player_one_member.id, self.player_two_member.id],
+            'seed': self.draft.seed,
+            'cube_hash': cube.cube_hash,
+            'starting_player': self.draft.starting_player.value,
+            'started_at': time.time(),
+        }
+        self.draft.game_log = game_log.GameLog.create(os.path.join(log_dir, f'{self.session_id}.log'), header)
+
+    def track(self, message):
+        self.owned_messages.setdefault(message.channel.id, set()).add(message.id)
+        return message
+
+    def play(self, action, version):
+        # False when the game moved on since the click, a double click or a click on a
+        # position that is gone is dropped instead of being applied as a second move
+        if version != self.version or not self.draft.inProgress():
+            return False
+
+        self.draft.applyAction(action)
+        self.version += 1
+        return True
+
+    def isPlayer(self, user_id):
+        return user_id in (
+            member.id for member in (self.player_one_member, self.player_two_member) if member
+        )
+
+    async def close(self, archive=True):
+        # Archived games aren't restored on the next start
+        if archive and self.draft.game_log is not None:
+            self.draft.game_log.archive()
+            self.draft.game_log = None
+        await self.tasks.close()
+        await self.updates.close()
+        await self.draft.close()
+
+
+class SessionManager:
+    # Registry of live sessions keyed by the id of the thread they are played in.
+    # Every session's draft shares one fetcher, one persistent card store and one
+    # in-memory card cache, so a card resolved for one game is warm for all of them.
+
+    def __init__(
+        self,
+        fetcher=None,
+        card_store=None,
+        cache_capacity=card_cache.DEFAULT_CAPACITY,
+        idle_timeout=DEFAULT_IDLE_TIMEOUT,
+        default_draft_file=None,
+        lookahead=DEFAULT_LOOKAHEAD,
+        status_debounce=status_updates.DEFAULT_DEBOUNCE,
+    ) -> None:
+        self.fetcher = fetcher if fetcher else card_fetcher.get_fetcher()
+        self.card_store = card_store if card_store else card_cache.get_card_store()
+        self.card_cache = card_cache.LRUCardCache(capacity=cache_capacity)
+        self.idle_timeout = idle_timeout
+        self.default_draft_file = default_draft_file
+        self.cubes = cube_registry.get_registry()
+        self.lookahead = lookahead
+        self.status_debounce = status_debounce
+
+        self._sessions = {}
+
+    async def restore(self, log_dir=game_log.GAME_LOG_DIR):
+        # Rebuilds the sessions of games that were still being played from their logs,
+        # returns (session, player ids) for each so the caller can reattach the members
+        restored = []
+        archive_dir = os.path.join(log_dir, 'archive')
+        for path in game_log.liveLogs(log_dir):
+            session = None
+            try:
+                log = game_log.GameLog.load(path)
+                header = log.header
+                players = header['players']
+                session = self.create(header['session_id'], header['channel_id'])
+                session.draft.restoreGame(log)
+            except Exception as error:
+                # One bad log mustn't keep the other games from coming back
+                logger.warning("Could not restore game %s: %s", path, error)
+                if session is not None:
+                    self._sessions.pop(session.session_id, None)
+                    await session.close(archive=False)
+                try:
+                    game_log.archiveLog(path, archive_dir)
+                except OSError as archive_error:
+                    logger.warning("Could not archive game log %s: %s", path, archive_error)
+                continue
+
+            session.game_started = True
+            restored.append((session, players))
+
+        # Cube files no logged game was dealt from are lists that were uploaded and never
+        # played, or played before the logs were cleared
+        logged = game_log.loggedCubes((log_dir, archive_dir))
+        pruned = self.cubes.prune(keep=logged)
+        if pruned:
+            logger.info("Pruned %d unused cube files", pruned)
+
+        return restored
+
+    def create(self, session_id, channel_id, draft_file=None):
+        draft = WinstonDraft(
+            fetcher=self.fetcher,
+            card_store=self.card_store,
+            memory_cache=self.card_cache,
+            lookahead=self.lookahead,
+        )
+        session = DraftSession(
+            session_id,
+            channel_id,
+            draft,
+            draft_file=draft_file if draft_file else self.default_draft_file,
+            cubes=self.cubes,
+            status_debounce=self.status_debounce,
+        )
+        self._sessions[session_id] = session
+        return session
+
+    def get(self, session_id):
+        session = self._sessions.get(session_id)
+        if session:
+            session.touch()
+        return session
+
+    def forChannel(self, channel_id):
+        # Sessions started from a channel, or the session played in it when it is a game thread
+        return [
+            session for session in self._sessions.values()
+            if channel_id in (session.channel_id, session.session_id)
+        ]
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    async def close(self, session_id, archive=True):
+        session = self._sessions.pop(session_id, None)
+        if session:
+            async with session.lock:
+                await session.close(archive=archive)
+        return session
+
+    async def evictIdle(self):
+        # Closes sessions nobody has touched within the idle timeout, returns them
+        idle = [
+            session for session in self._sessions.values()
+            if session.idleFor() > self.idle_timeout and not session.lock.locked()
+        ]
+        for session in idle:
+            await self.close(session.session_id)
+        return idle
+
+    async def closeAll(self, archive=True):
+        for session_id in list(self._sessions):
+            await self.close(session_id, archive=archive)
@@ -0,0 +1,259 @@
+import enum
+from array import array
+
+from cube_registry import CARD_ID_TYPE
+
+PILE_COUNT = 3
+
+_MASK64 = (1 << 64) - 1
+
+_NO_CARDS = array(CARD_ID_TYPE)
+
+
+class Action(enum.Enum):
+    TAKE = 0
+    PASS = 1
+
+
+def _mix(value):
+    # splitmix64 finalizer, spreads small integers over 64 bits
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+def _card_key(card_id, location):
+    # Locations 0-2 are the piles, 3-4 the players' pulls
+    return _mix(card_id * 8 + location + 1)
+
+
+def _cards_key_of(card_ids, location):
+    return sum(_card_key(card_id, location) for card_id in card_ids)
+
+
+class DraftState:
+    # Immutable position of a Winston draft. apply() returns a new state that shares
+    # everything the move didn't touch: the deck is never copied, drawing only lowers
+    # `remaining`, and untouched piles and pulls are the same arrays.
+    #
+    # The deck, piles and pulls are compact card id arrays. They are shared between
+    # states and never changed in place, a move that adds cards builds a new array.
+    #
+    # The hash is a sum of per card keys kept up to date as cards move, so hashing
+    # a state costs the same however far into the draft it is.
+
+    __slots__ = (
+        "deck", "remaining", "piles", "pulls",
+        "current_pile", "current_player", "starting_player", "_cards_key",
+    )
+
+    def __init__(self, deck, remaining, piles, pulls, current_pile, current_player, starting_player, cards_key=None):
+        if cards_key is None:
+            cards_key = sum(_cards_key_of(pile, location) for location, pile in enumerate(piles))
+            cards_key += sum(_cards_key_of(pull, PILE_COUNT + player) for player, pull in enumerate(pulls))
+
+        object.__setattr__(self, "deck", deck)
+        object.__setattr__(self, "remaining", remaining)
+        object.__setattr__(self, "piles", piles)
+        object.__setattr__(self, "pulls", pulls)
+        object.__setattr__(self, "current_pile", current_pile)
+        object.__setattr__(self, "current_player", current_player)
+        object.__setattr__(self, "starting_player", starting_player)
+        object.__setattr__(self, "_cards_key", cards_key & _MASK64)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    @classmethod
+    def new(cls, deck, starting_player=0):
+        # Cards are drawn from the end of the deck, one into each pile to start
+        deck = array(CARD_ID_TYPE, deck)
+        dealt = min(PILE_COUNT, len(deck))
+        piles = tuple(
+            array(CARD_ID_TYPE, (deck[len(deck) - 1 - pile],)) if pile < dealt else _NO_CARDS
+            for pile in range(PILE_COUNT)
+        )
+        return cls(deck, len(deck) - dealt, piles, (_NO_CARDS, _NO_CARDS), 0, starting_player, starting_player)
+
+    @classmethod
+    def from_snapshot(cls, deck, snapshot):
+        # The deck isn't part of a snapshot, it is dealt again from the game's seed
+        return cls(
+            deck if isinstance(deck, array) else array(CARD_ID_TYPE, deck),
+            snapshot["remaining"],
+            tuple(array(CARD_ID_TYPE, pile) for pile in snapshot["piles"]),
+            tuple(array(CARD_ID_TYPE, pull) for pull in snapshot["pulls"]),
+            snapshot["current_pile"],
+            snapshot["current_player"],
+            snapshot["starting_player"],
+        )
+
+    def snapshot(self):
+        return {
+            "remaining": self.remaining,
+            "piles": [pile.tolist() for pile in self.piles],
+            "pulls": [pull.tolist() for pull in self.pulls],
+            "current_pile": self.current_pile,
+            "current_player": self.current_player,
+            "starting_player": self.starting_player,
+        }
+
+    def _replace(self, **changes):
+        values = {name.lstrip("_"): getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return DraftState(**values)
+
+    def cards_remaining(self):
+        return self.remaining
+
+    def next_card(self):
+        return self.deck[self.remaining - 1] if self.remaining else None
+
+    def current_pile_cards(self):
+        return self.piles[self.current_pile]
+
+    def is_over(self):
+        return not self.remaining and not any(self.piles)
+
+    def legal_actions(self):
+        return () if self.is_over() else (Action.TAKE, Action.PASS)
+
+    def taken_pile(self):
+        # Index of the pile a take would claim: empty piles are skipped, None past the last pile
+        for pile in range(self.current_pile, PILE_COUNT):
+            if self.piles[pile]:
+                return pile
+        return None
+
+    def apply(self, action):
+        if self.is_over():
+            raise ValueError("The draft is over")
+
+        if action == Action.TAKE:
+            return self._take()
+        if action == Action.PASS:
+            return self._pass()
+
+        raise ValueError(f"Unknown action: {action}")
+
+    def _take(self):
+        player = self.current_player
+        pile = self.taken_pile()
+        if pile is None:
+            return self._replace(current_pile=0, current_player=1 - player)
+
+        taken = self.piles[pile]
+        cards_key = self._cards_key - _cards_key_of(taken, pile) + _cards_key_of(taken, PILE_COUNT + player)
+
+        # The emptied pile gets the next card of the draft pile
+        refill = _NO_CARDS
+        remaining = self.remaining
+        if remaining:
+            remaining -= 1
+            refill = self.deck[remaining:remaining + 1]
+            cards_key += _card_key(refill[0], pile)
+
+        piles = self.piles[:pile] + (refill,) + self.piles[pile + 1:]
+        pulls = self.pulls[:player] + (self.pulls[player] + taken,) + self.pulls[player + 1:]
+
+        return self._replace(
+            remaining=remaining,
+            piles=piles,
+            pulls=pulls,
+            current_pile=0,
+            current_player=1 - player,
+            cards_key=cards_key,
+        )
+
+    def _pass(self):
+        player = self.current_player
+        pile = self.current_pile
+        remaining = self.remaining
+        cards_key = self._cards_key
+        piles = self.piles
+        pulls = self.pulls
+
+        # The passed pile gets the next card of the draft pile
+        if remaining:
+            remaining -= 1
+            card = self.deck[remaining]
+            piles = piles[:pile] + (piles[pile] + self.deck[remaining:remaining + 1],) + piles[pile + 1:]
+            cards_key += _card_key(card, pile)
+
+        if pile < PILE_COUNT - 1:
+            return self._replace(remaining=remaining, piles=piles, current_pile=pile + 1, cards_key=cards_key)
+
+        # Passing the last pile means a blind pick from the draft pile, if anything is left
+        if not remaining:
+            return self._replace(remaining=remaining, piles=piles, current_pile=0, cards_key=cards_key)
+
+        remaining -= 1
+        card = self.deck[remaining]
+        pulls = pulls[:player] + (pulls[player] + self.deck[remaining:remaining + 1],) + pulls[player + 1:]
+        cards_key += _card_key(card, PILE_COUNT + player)
+
+        return self._replace(
+            remaining=remaining,
+            piles=piles,
+            pulls=pulls,
+            current_pile=0,
+            current_player=1 - player,
+            cards_key=cards_key,
+        )
+
+    def __hash__(self):
+        return hash((self._cards_key, self.remaining, self.current_pile, self.current_player))
+
+    def __eq__(self, other):
+        if not isinstance(other, DraftState):
+            return NotImplemented
+
+        return (
+            self._cards_key == other._cards_key
+            and self.remaining == other.remaining
+            and self.current_pile == other.current_pile
+            and self.current_player == other.current_player
+            and self.starting_player == other.starting_player
+            and self.piles == other.piles
+            and self.pulls == other.pulls
+            and (self.deck is other.deck or self.deck == other.deck)
+        )
+
+    def __repr__(self):
+        return (
+            f"DraftState(remaining={self.remaining}, piles={self.piles}, "
+            f"pulls={tuple(len(pull) for pull in self.pulls)}, "
+            f"current_pile={self.current_pile}, current_player={self.current_player})"
+        )
+
+
+class DraftHistory:
+    # Move stack over immutable states: play and undo are both O(1) since
+    # earlier states are kept as they were
+
+    __slots__ = ("states", "actions")
+
+    def __init__(self, state) -> None:
+        self.states = [state]
+        self.actions = []
+
+    @property
+    def state(self):
+        return self.states[-1]
+
+    def play(self, action):
+        state = self.state.apply(action)
+        self.states.append(state)
+        self.actions.append(action)
+        return state
+
+    def undo(self):
+        if not self.actions:
+            raise IndexError("Nothing to undo")
+
+        self.states.pop()
+        return self.actions.pop()
+
+    def __len__(self):
+        return len(self.actions)
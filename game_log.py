@@ -0,0 +1,186 @@
+import json
+import os
+import time
+
+from draft_state import Action, PILE_COUNT, DraftState
+
+GAME_LOG_DIR = 'draft_files/games'
+ARCHIVE_DIR = 'draft_files/games/archive'
+
+# Moves between state snapshots, recovery only replays the codes after the last one
+SNAPSHOT_INTERVAL = 16
+
+# One byte per move: the action in the low bit and the pile index above it,
+# PILE_COUNT being a take past the last pile
+_UNDO = 0xFF
+
+
+def encodeAction(action, pile):
+    return (PILE_COUNT if pile is None else pile) << 1 | action.value
+
+
+def decodeAction(code):
+    # Returns (action, pile), (None, None) for an undo
+    if code == _UNDO:
+        return None, None
+
+    pile = code >> 1
+    return Action(code & 1), None if pile == PILE_COUNT else pile
+
+
+def _writeAtomic(path, data):
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as outfile:
+        outfile.write(data)
+    os.replace(temp_path, path)
+
+
+class GameLog:
+    # Append-only record of one game: a JSON header line with the seed, the hash of
+    # the registered cube and the session it was dealt for, then one byte per move.
+    # A snapshot of the state is written next to it every SNAPSHOT_INTERVAL moves,
+    # undos don't count towards it.
+
+    def __init__(self, path, header, codes=b'') -> None:
+        self.path = path
+        self.header = header
+        self.codes = bytearray(codes)
+
+        self._file = None
+        self._unsnapshotted = 0
+
+    @classmethod
+    def create(cls, path, header):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        _writeAtomic(path, json.dumps(header).encode('utf-8') + b'\n')
+        return cls(path, header)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as infile:
+            header, _, codes = infile.read().partition(b'\n')
+
+        return cls(path, json.loads(header), codes)
+
+    @property
+    def seed(self):
+        return self.header['seed']
+
+    @property
+    def cube_hash(self):
+        return self.header['cube_hash']
+
+    @property
+    def snapshot_path(self):
+        return f'{self.path}.snapshot'
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _write(self, code, state):
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+
+        self.codes.append(code)
+        self._file.write(bytes((code,)))
+        self._file.flush()
+
+        if code == _UNDO:
+            return
+
+        self._unsnapshotted += 1
+        if self._unsnapshotted >= SNAPSHOT_INTERVAL:
+            self.writeSnapshot(state)
+
+    def append(self, action, pile, state):
+        self._write(encodeAction(action, pile), state)
+
+    def appendUndo(self, state):
+        self._write(_UNDO, state)
+
+    def actions(self, start=0):
+        return [decodeAction(code) for code in self.codes[start:]]
+
+    def writeSnapshot(self, state):
+        snapshot = {'moves': len(self.codes), 'state': state.snapshot()}
+        _writeAtomic(self.snapshot_path, json.dumps(snapshot).encode('utf-8'))
+        self._unsnapshotted = 0
+
+    def undoesPast(self, start):
+        # Whether the undos after code `start` take back moves logged before it
+        depth = 0
+        for code in self.codes[start:]:
+            depth += -1 if code == _UNDO else 1
+            if depth < 0:
+                return True
+        return False
+
+    def readSnapshot(self, deck):
+        # Returns (moves, state) for the last snapshot, (0, None) when there isn't a usable
+        # one. A snapshot that a later undo reaches past is no use, the history it starts
+        # has nothing to undo, so the game is replayed from its seed instead.
+        try:
+            with open(self.snapshot_path, 'rb') as infile:
+                snapshot = json.loads(infile.read())
+        except (OSError, ValueError):
+            return 0, None
+
+        if snapshot['moves'] > len(self.codes) or self.undoesPast(snapshot['moves']):
+            return 0, None
+
+        return snapshot['moves'], DraftState.from_snapshot(deck, snapshot['state'])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def archive(self, directory=ARCHIVE_DIR):
+        # Finished games keep just the header and moves, everything else can be replayed
+        self.close()
+        self.path = archiveLog(self.path, directory)
+        return self.path
+
+
+def archiveLog(path, directory=ARCHIVE_DIR):
+    # Moves a log out of the live games, also one that can't be read, returns its new path
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.splitext(os.path.basename(path))[0]
+    archived_path = os.path.join(directory, f'{name}-{int(time.time())}.log')
+    os.replace(path, archived_path)
+    if os.path.exists(f'{path}.snapshot'):
+        os.remove(f'{path}.snapshot')
+
+    return archived_path
+
+
+def loggedCubes(directories=(GAME_LOG_DIR, ARCHIVE_DIR)):
+    # Hashes of the cubes logged games were dealt from, only the header lines are read
+    cube_hashes = set()
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+
+        for name in os.listdir(directory):
+            if not name.endswith('.log'):
+                continue
+            try:
+                with open(os.path.join(directory, name), 'rb') as infile:
+                    cube_hashes.add(json.loads(infile.readline())['cube_hash'])
+            except (OSError, ValueError, KeyError):
+                continue
+
+    return cube_hashes
+
+
+def liveLogs(directory=GAME_LOG_DIR):
+    # Paths of the logs of games that were still being played, loading them is left to
+    # the caller so one unreadable log can be dealt with on its own
+    if not os.path.isdir(directory):
+        return []
+
+    return [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.endswith('.log')
+    ]
@@ -0,0 +1,289 @@
+import asyncio
+import bisect
+import functools
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+from aiohttp import web
+
+DEFAULT_METRICS_HOST = '127.0.0.1'
+DEFAULT_METRICS_PORT = 9108
+
+# Discord fails an interaction that isn't acknowledged within this many seconds
+INTERACTION_DEADLINE = 3.0
+
+# Seconds, from a cache hit up to a request that sat out a 429
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+
+def _label_text(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    # Monotonic count, optionally split by label values or read from a callback when
+    # exported for a count kept elsewhere
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=(), function=None) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.function = function
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels[label]) for label in self.labels), 0)
+
+    def samples(self):
+        if self.function is not None:
+            yield self.name, '', self.function()
+            return
+
+        for key, value in self._values.items():
+            yield self.name, _label_text(self.labels, key), value
+
+
+class Gauge(Counter):
+    # Current value, either set directly or read from a callback when exported
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        self._values[tuple(str(labels[label]) for label in self.labels)] = value
+
+
+class Histogram:
+    # Cumulative bucket counts plus sum and count, the Prometheus histogram layout
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def quantile(self, quantile, **labels):
+        # Upper bound of the bucket holding the quantile, good enough for a summary
+        entry = self._values.get(tuple(str(labels[label]) for label in self.labels))
+        if not entry or not entry[2]:
+            return None
+
+        rank = quantile * entry[2]
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), entry[0]):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def keys(self):
+        return [dict(zip(self.labels, key)) for key in self._values]
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(str(labels[label]) for label in self.labels))
+        return entry[2] if entry else 0
+
+    def total(self, **labels):
+        entry = self._values.get(tuple(str(labels[label]) for label in self.labels))
+        return entry[1] if entry else 0.0
+
+    def samples(self):
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket', _label_text(self.labels, key, [('le', le)]), cumulative
+            yield f'{self.name}_sum', _label_text(self.labels, key), total
+            yield f'{self.name}_count', _label_text(self.labels, key), count
+
+
+class _Timer:
+    def __init__(self, histogram, labels) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    # Every metric by name, registering a name twice returns the existing metric
+
+    def __init__(self) -> None:
+        self._metrics = {}
+
+    def _register(self, metric_type, name, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = metric_type(name, *args, **kwargs)
+        return metric
+
+    def counter(self, name, help_text, labels=(), function=None):
+        return self._register(Counter, name, help_text, labels, function)
+
+    def gauge(self, name, help_text, labels=(), function=None):
+        return self._register(Gauge, name, help_text, labels, function)
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, help_text, labels, buckets)
+
+    def __iter__(self):
+        return iter(list(self._metrics.values()))
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        for metric in self:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+interactions = counter('bot_interactions_total', 'Interactions handled', ('handler', 'outcome'))
+interaction_seconds = histogram('bot_interaction_seconds', 'Interaction handler time', ('handler',))
+interaction_ack_seconds = histogram(
+    'bot_interaction_ack_seconds', 'Time from an interaction being created to its acknowledgement', ('handler',)
+)
+interaction_queue_seconds = histogram(
+    'bot_interaction_queue_seconds', 'Time an acknowledged interaction waited on its session queue', ('handler',)
+)
+late_interactions = counter('bot_interactions_late_total', 'Interactions acknowledged after the deadline', ('handler',))
+loop_lag_seconds = histogram('bot_event_loop_lag_seconds', 'How late the event loop woke a sleeping task')
+
+
+def instrumented(handler):
+    # Counts and times an async interaction handler, errors are counted and re-raised
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            outcome = 'ok'
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            except Exception:
+                outcome = 'error'
+                raise
+            finally:
+                interaction_seconds.observe(time.perf_counter() - start, handler=handler)
+                interactions.inc(handler=handler, outcome=outcome)
+
+        return wrapper
+
+    return decorator
+
+
+def record_ack(handler, seconds):
+    interaction_ack_seconds.observe(seconds, handler=handler)
+    if seconds > INTERACTION_DEADLINE:
+        late_interactions.inc(handler=handler)
+
+
+async def monitor_loop_lag(interval=0.1):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        loop_lag_seconds.observe(max(0.0, time.perf_counter() - start - interval))
+
+
+def summary(registry=REGISTRY):
+    # Short human readable digest for the admin command
+    lines = []
+    for metric in registry:
+        if isinstance(metric, Histogram):
+            for labels in metric.keys():
+                p50 = metric.quantile(0.5, **labels)
+                p99 = metric.quantile(0.99, **labels)
+                label_text = _label_text(metric.labels, labels.values())
+                lines.append(
+                    f'{metric.name}{label_text}: n={metric.count(**labels)} '
+                    f'p50<={p50 * 1000:.0f}ms p99<={p99 * 1000:.0f}ms'
+                )
+        else:
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels}: {value:g}' if isinstance(value, (int, float)) else f'{name}{labels}: {value}')
+    return '\n'.join(lines)
+
+
+async def start_server(host=DEFAULT_METRICS_HOST, port=DEFAULT_METRICS_PORT, registry=REGISTRY):
+    # Serves GET /metrics, returns the runner so the caller can clean it up
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info('Serving metrics on http://%s:%s/metrics', host, port)
+    return runner
+
+
+_log_listener = None
+
+
+def setup_logging(level=logging.INFO):
+    # Log calls only put the record on a queue, a listener thread does the writing
+    global _log_listener
+    if _log_listener is not None:
+        return _log_listener
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _log_listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _log_listener.start()
+    return _log_listener
+
+
+def stop_logging():
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+
+import metrics
+
+DEFAULT_DEBOUNCE = 0.5
+
+logger = logging.getLogger(__name__)
+
+updates = metrics.counter('bot_message_updates_total', 'Scheduled message updates by outcome', ('outcome',))
+
+
+class UpdateScheduler:
+    # Coalesces the edits of one session's messages. schedule() marks a message as
+    # stale, `debounce` seconds later its payload is built once from the state at
+    # that point and only sent when it differs from what the message already shows.
+    # A burst of moves inside the window costs one edit instead of one per move.
+
+    def __init__(self, debounce=DEFAULT_DEBOUNCE) -> None:
+        self.debounce = debounce
+
+        self._pending = {}
+        self._shown = {}
+        self._tasks = {}
+
+    def schedule(self, key, build, send):
+        # `build` is an async callable returning the payload, `send(payload)` edits the message
+        if key in self._pending:
+            updates.inc(outcome='coalesced')
+        self._pending[key] = (build, send)
+
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._flush(key))
+
+    def shown(self, key):
+        return self._shown.get(key)
+
+    def mark_shown(self, key, payload):
+        # For messages sent or edited outside the scheduler
+        self._shown[key] = payload
+
+    def forget(self, key):
+        self._shown.pop(key, None)
+
+    async def _flush(self, key):
+        try:
+            await asyncio.sleep(self.debounce)
+            build, send = self._pending.pop(key)
+            payload = await build()
+            if payload == self._shown.get(key):
+                updates.inc(outcome='unchanged')
+                return
+
+            await send(payload)
+            self._shown[key] = payload
+            updates.inc(outcome='sent')
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            # The message may be gone, the next update starts from scratch
+            logger.warning("Update of %s failed: %s", key, error)
+            self.forget(key)
+            updates.inc(outcome='failed')
+        finally:
+            del self._tasks[key]
+            # Changes that came in while this update was being sent get their own
+            if key in self._pending:
+                self._tasks[key] = asyncio.create_task(self._flush(key))
+
+    async def close(self):
+        self._pending.clear()
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,107 @@
+import card_cache
+
+LOTUS = {'name': 'Black Lotus'}
+BOLT = {'name': 'Lightning Bolt'}
+
+
+def test_least_recently_used_goes_first():
+    cache = card_cache.LRUCardCache(capacity=2)
+    cache['Black Lotus'] = LOTUS
+    cache['Lightning Bolt'] = BOLT
+    assert cache['Black Lotus'] is LOTUS
+
+    cache['Counterspell'] = {'name': 'Counterspell'}
+
+    assert 'Lightning Bolt' not in cache
+    assert 'Black Lotus' in cache and 'Counterspell' in cache
+    assert len(cache) == 2
+    assert cache.evictions == 1
+
+
+def test_hits_and_misses():
+    cache = card_cache.LRUCardCache(capacity=4)
+    cache.put('Black Lotus', LOTUS)
+
+    assert cache.get('Black Lotus') is LOTUS
+    assert cache.get('Lightning Bolt') is None
+    assert cache.get('Lightning Bolt', card_cache.MISSING) is card_cache.MISSING
+    # peek and membership don't count
+    assert cache.peek('Black Lotus') is LOTUS
+    assert 'Lightning Bolt' not in cache
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 2)
+    assert stats['hit_ratio'] == 1 / 3
+    assert stats['size'] == 1 and stats['capacity'] == 4
+
+
+def test_not_found_is_cached_briefly(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(card_cache.time, 'monotonic', lambda: now[0])
+    cache = card_cache.LRUCardCache(negative_ttl=60)
+    cache.update({'Not A Card': None, 'Black Lotus': LOTUS})
+
+    assert 'Not A Card' in cache
+    assert cache.get('Not A Card', card_cache.MISSING) is None
+
+    now[0] += 61
+    assert 'Not A Card' not in cache
+    assert cache.get('Black Lotus') is LOTUS
+
+
+def test_empty_names_are_ignored():
+    cache = card_cache.LRUCardCache()
+    cache.put('', LOTUS)
+    cache.put(None, LOTUS)
+
+    assert len(cache) == 0
+
+
+def test_slim_card_keeps_rendered_fields_and_faces():
+    card = card_cache.slim_card({
+        'name': 'Delver of Secrets // Insectile Aberration',
+        'scryfall_uri': 'https://scryfall.com',
+        'oracle_text': 'dropped',
+        'card_faces': [
+            {'mana_cost': '{U}', 'image_uris': {'normal': 'front.jpg'}},
+            {'mana_cost': '', 'image_uris': {'normal': 'back.jpg'}},
+        ],
+    })
+
+    assert set(card) == set(card_cache.CARD_FIELDS)
+    assert card['mana_cost'] == '{U} // '
+    assert card['image_uris'] == {'normal': 'front.jpg'}
+    assert card_cache.slim_card(None) is None
+
+
+def test_store_reads_fresh_cards_with_their_fetch_time(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(card_cache.time, 'time', lambda: now[0])
+    store = card_cache.PersistentCardCache(str(tmp_path / 'cards.sqlite3'), ttl=60)
+    store.put('Black Lotus', LOTUS)
+    now[0] += 30
+    store.put('Lightning Bolt', BOLT)
+
+    fetched = store.get_many_fetched(['Black Lotus', 'Lightning Bolt', 'Counterspell'])
+    assert fetched['Black Lotus'][1] == 1000.0
+    assert fetched['Lightning Bolt'][1] == 1030.0
+    assert store.get_many(['Black Lotus', 'Counterspell']) == {'Black Lotus': card_cache.slim_card(LOTUS)}
+
+    now[0] += 31
+    assert set(store.get_many_fetched(['Black Lotus', 'Lightning Bolt'])) == {'Lightning Bolt'}
+    store.close()
+
+
+def test_purge_drops_only_stale_rows(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(card_cache.time, 'time', lambda: now[0])
+    store = card_cache.PersistentCardCache(str(tmp_path / 'cards.sqlite3'), ttl=60)
+    store.put('Black Lotus', LOTUS)
+    now[0] += 30
+    store.put('Lightning Bolt', BOLT)
+
+    now[0] += 31
+    store.purge_stale()
+    names = [row[0] for row in store._connect().execute('SELECT name FROM cards')]
+    assert names == ['Lightning Bolt']
+    store.close()
@@ -0,0 +1,183 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+import card_cache
+import card_fetcher
+from benchmarks.scryfall_stub import ScryfallStub
+from winston import WinstonDraft
+
+
+def run_against_stub(stub, lookups, **fetcher_options):
+    async def run():
+        base_url = await stub.start()
+        fetcher_options.setdefault('rate_limiter', card_fetcher.TokenBucket(rate=1000))
+        fetcher = card_fetcher.CardFetcher(base_url=base_url, **fetcher_options)
+        try:
+            return fetcher, await lookups(fetcher)
+        finally:
+            await fetcher.close()
+            await stub.close()
+
+    return asyncio.run(run())
+
+
+def test_collection_resolves_in_batches():
+    stub = ScryfallStub(latency=0, not_found=['Not A Card'])
+    names = [f'Card {index}' for index in range(100)] + ['Not A Card']
+
+    _, cards = run_against_stub(stub, lambda fetcher: fetcher.fetch_collection(names, fuzzy_fallback=False))
+
+    assert stub.requests == 2
+    assert cards['Card 99']['name'] == 'Card 99'
+    assert cards['Not A Card'] is None
+
+
+def test_failed_collection_batches_are_left_unresolved():
+    stub = ScryfallStub(latency=0, error_rate=1.0)
+    names = [f'Card {index}' for index in range(150)]
+
+    fetcher, cards = run_against_stub(stub, lambda fetcher: fetcher.fetch_collection(names), max_retries=0)
+
+    # One request per batch and no fuzzy lookup per name
+    assert stub.requests == 2
+    assert cards == {}
+    assert not fetcher._in_flight
+
+
+def test_card_list_validation_raises_during_an_outage(tmp_path):
+    stub = ScryfallStub(latency=0, error_rate=1.0)
+    card_store = card_cache.PersistentCardCache(str(tmp_path / 'cards.sqlite3'))
+
+    async def validate(fetcher):
+        draft = WinstonDraft(fetcher=fetcher, card_store=card_store, memory_cache=card_cache.LRUCardCache())
+        with pytest.raises(card_fetcher.CardLookupError):
+            await draft.validateCardList("Lightning Bolt\nCounterspell")
+
+    run_against_stub(stub, validate, max_retries=0)
+    card_store.close()
+
+
+class FailFirstStub(ScryfallStub):
+    # Answers the first `failures` requests with `status`, the rest normally
+    def __init__(self, failures=1, status=429, **kwargs) -> None:
+        super().__init__(latency=0, **kwargs)
+        self.failures = failures
+        self.status = status
+
+    async def _respond(self):
+        self.requests += 1
+        if self.requests > self.failures:
+            return None
+        if self.status == 429:
+            self.throttled += 1
+            return web.json_response(
+                {'object': 'error', 'status': 429}, status=429, headers={'Retry-After': str(self.retry_after)}
+            )
+        self.errors += 1
+        return web.Response(status=self.status)
+
+
+def test_token_bucket_paces_requests():
+    async def run():
+        bucket = card_fetcher.TokenBucket(rate=50)
+        start = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - start, bucket
+
+    elapsed, bucket = asyncio.run(run())
+
+    # The first token is there already, each later one takes 1/rate seconds
+    assert elapsed >= 5 / 50 * 0.9
+    assert bucket.acquired == 6 and bucket.delayed == 5
+
+
+def test_429_blocks_the_bucket_for_retry_after():
+    stub = FailFirstStub(status=429, retry_after=0.3)
+
+    async def lookup(fetcher):
+        start = time.monotonic()
+        card = await fetcher.fetch_card('Black Lotus', fuzzy=False)
+        return card, time.monotonic() - start
+
+    fetcher, (card, elapsed) = run_against_stub(stub, lookup)
+
+    assert card['name'] == 'Black Lotus'
+    assert stub.requests == 2
+    assert fetcher.throttled == 1
+    assert elapsed >= 0.3 * 0.9
+    assert fetcher.rate_limiter.max_wait >= 0.3 * 0.9
+
+
+def test_server_errors_are_retried():
+    stub = FailFirstStub(failures=2, status=503)
+
+    fetcher, card = run_against_stub(
+        stub, lambda fetcher: fetcher.fetch_card('Counterspell', fuzzy=False), backoff_base=0.01
+    )
+
+    assert card['name'] == 'Counterspell'
+    assert stub.requests == 3
+    assert fetcher.retries == 2
+
+
+def test_retries_give_up_with_none():
+    stub = ScryfallStub(latency=0, error_rate=1.0)
+
+    fetcher, card = run_against_stub(
+        stub, lambda fetcher: fetcher.fetch_card('Counterspell', fuzzy=False), max_retries=2, backoff_base=0.01
+    )
+
+    assert card is None
+    assert stub.requests == 3
+    assert fetcher.retries == 2
+
+
+def test_concurrent_lookups_share_one_request():
+    stub = ScryfallStub(latency=0.05)
+
+    async def lookups(fetcher):
+        names = ['Black Lotus'] * 9 + ['BLACK LOTUS']
+        return await asyncio.gather(*(fetcher.fetch_card(name, fuzzy=False) for name in names))
+
+    fetcher, cards = run_against_stub(stub, lookups)
+
+    assert stub.requests == 1
+    assert fetcher.coalesced == 9
+    assert all(card is cards[0] for card in cards)
+    assert not fetcher._in_flight
+
+
+def test_lookups_join_a_collection_request_in_flight():
+    stub = ScryfallStub(latency=0.05)
+
+    async def lookups(fetcher):
+        collection = asyncio.ensure_future(fetcher.fetch_collection(['Black Lotus', 'Counterspell']))
+        await asyncio.sleep(0)
+        card = await fetcher.fetch_card('Counterspell', fuzzy=False)
+        return card, await collection
+
+    fetcher, (card, cards) = run_against_stub(stub, lookups)
+
+    assert stub.requests == 1
+    assert card is cards['Counterspell']
+    assert fetcher.coalesced == 1
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_lookup():
+    stub = ScryfallStub(latency=0.05)
+
+    async def lookups(fetcher):
+        first = asyncio.ensure_future(fetcher.fetch_card('Black Lotus', fuzzy=False))
+        second = asyncio.ensure_future(fetcher.fetch_card('Black Lotus', fuzzy=False))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    _, card = run_against_stub(stub, lookups)
+
+    assert card['name'] == 'Black Lotus'
+    assert stub.requests == 1
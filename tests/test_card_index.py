@@ -0,0 +1,170 @@
+import asyncio
+import json
+import os
+import sqlite3
+
+import pytest
+
+import card_fetcher
+import card_index
+from tests.conftest import FIXTURES
+
+ORACLE_CARDS = os.path.join(FIXTURES, 'oracle-cards.json')
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = card_index.CardIndex(str(tmp_path / 'index.sqlite3'))
+    index.build(ORACLE_CARDS)
+    yield index
+    index.close()
+
+
+def test_normalize_name():
+    assert card_index.normalize_name("Lim-Dûl's Vault") == 'lim duls vault'
+    assert card_index.normalize_name('  Fire // ICE ') == 'fire // ice'
+
+
+def test_iter_bulk_cards_streams_across_chunks(monkeypatch):
+    # Small reads make objects straddle chunk boundaries
+    monkeypatch.setattr(card_index, '_READ_SIZE', 7)
+    cards = list(card_index.iter_bulk_cards(ORACLE_CARDS))
+
+    assert len(cards) == 9
+    assert cards[0]['name'] == 'Black Lotus'
+    assert cards[-1]['object'] == 'ruling'
+
+
+def test_iter_bulk_cards_rejects_truncated_file(tmp_path):
+    path = tmp_path / 'truncated.json'
+    path.write_text('[{"object": "card", "name": "Black Lotus"}, {"object": "ca', encoding='utf-8')
+
+    with pytest.raises(ValueError):
+        list(card_index.iter_bulk_cards(str(path)))
+
+
+def test_build_counts_cards_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(card_index, '_READ_SIZE', 64)
+    index = card_index.CardIndex(str(tmp_path / 'index.sqlite3'))
+
+    assert index.build(ORACLE_CARDS, batch_size=2) == 8
+    assert len(index) == 8
+    # Building again replaces the contents
+    assert index.build(ORACLE_CARDS) == 8
+    assert len(index) == 8
+    index.close()
+
+
+def test_exact(index):
+    card = index.exact('lightning bolt')
+
+    assert card['name'] == 'Lightning Bolt'
+    assert card['mana_cost'] == '{R}'
+    assert set(card) == set(card_index.card_cache.CARD_FIELDS)
+    assert index.exact("LIM-DUL'S VAULT")['name'] == "Lim-Dûl's Vault"
+    assert index.exact('Lightning') is None
+
+
+def test_exact_many(index):
+    cards = index.exact_many(['Black Lotus', 'black lotus', 'Counterspell', 'Not A Card', ''])
+
+    assert set(cards) == {'Black Lotus', 'black lotus', 'Counterspell'}
+    assert cards['black lotus']['name'] == 'Black Lotus'
+
+
+def test_multi_face_keys(index):
+    for name in ('Delver of Secrets', 'Insectile Aberration', 'Delver of Secrets // Insectile Aberration'):
+        assert index.exact(name)['name'] == 'Delver of Secrets // Insectile Aberration'
+
+    assert index.exact('Fire')['name'] == 'Fire // Ice'
+    assert index.exact('Ice')['name'] == 'Fire // Ice'
+    # Faces keep the mana cost and image the card itself lacks
+    assert index.exact('Delver of Secrets')['mana_cost'] == '{U} // '
+    assert index.exact('Delver of Secrets')['image_uris']['normal'].endswith('front/2/8/28059d09.jpg')
+
+
+def test_fuzzy_unique_prefix(index):
+    assert index.fuzzy('swords to')['name'] == 'Swords to Plowshares'
+    assert index.fuzzy('Counter')['name'] == 'Counterspell'
+
+
+def test_fuzzy_closest_spelling(index):
+    assert index.fuzzy('Lightnig Bolt')['name'] == 'Lightning Bolt'
+    assert index.fuzzy('Blak Lotus')['name'] == 'Black Lotus'
+    # An ambiguous prefix falls through to the closest spelling
+    assert index.fuzzy('Lightning')['name'] in ('Lightning Bolt', 'Lightning Helix')
+    assert index.fuzzy('Zzyzx') is None
+    assert index.fuzzy('!!') is None
+
+
+def test_suggest(index):
+    assert index.suggest('Lightning Blot')[0] == 'Lightning Bolt'
+    assert index.suggest('Zzyzx') == []
+
+
+class OfflineFetcher(card_fetcher.CardFetcher):
+    def _get_session(self):
+        raise AssertionError('Offline lookups must not reach the API')
+
+
+def test_fetcher_offline_makes_no_api_calls(index):
+    fetcher = OfflineFetcher(index=index, offline=True)
+
+    async def lookups():
+        return (
+            await fetcher.fetch_card('Counterspell', fuzzy=False),
+            await fetcher.fetch_card('Not A Card', fuzzy=False),
+            await fetcher.fetch_card('Lightnig Bolt', fuzzy=True),
+            await fetcher.fetch_collection(['Black Lotus', 'Ice', 'Blak Lotus', 'Zzyzx']),
+            await fetcher.fetch_collection(['Blak Lotus'], fuzzy_fallback=False),
+            await fetcher.suggest_names('Zzyzx'),
+        )
+
+    exact, missing, fuzzy, collection, no_fallback, suggestions = asyncio.run(lookups())
+
+    assert exact['name'] == 'Counterspell'
+    assert missing is None
+    assert fuzzy['name'] == 'Lightning Bolt'
+    assert collection['Black Lotus']['name'] == 'Black Lotus'
+    assert collection['Ice']['name'] == 'Fire // Ice'
+    assert collection['Blak Lotus']['name'] == 'Black Lotus'
+    assert collection['Zzyzx'] is None
+    assert no_fallback == {'Blak Lotus': None}
+    assert suggestions == []
+    assert fetcher.rate_limiter.acquired == 0
+
+
+def test_build_skips_non_game_cards_and_prefers_full_names(tmp_path):
+    bulk = [
+        {'object': 'card', 'name': 'Lightning Bolt // Lightning Bolt', 'layout': 'art_series'},
+        {'object': 'card', 'name': 'Goblin', 'layout': 'token'},
+        {'object': 'card', 'name': 'Alpha // Beta', 'layout': 'split', 'mana_cost': '{1} // {2}'},
+        {'object': 'card', 'name': 'Lightning Bolt', 'layout': 'normal', 'mana_cost': '{R}'},
+        {'object': 'card', 'name': 'Beta', 'layout': 'normal', 'mana_cost': '{B}'},
+        {'object': 'card', 'name': 'Gamma // Alpha', 'layout': 'split'},
+    ]
+    path = tmp_path / 'bulk.json'
+    path.write_text(json.dumps(bulk), encoding='utf-8')
+    index = card_index.CardIndex(str(tmp_path / 'index.sqlite3'))
+
+    assert index.build(str(path)) == 4
+    assert index.exact('Lightning Bolt')['mana_cost'] == '{R}'
+    assert index.exact('Goblin') is None
+    # A full name wins over an earlier face, between two faces the first card keeps the key
+    assert index.exact('Beta')['name'] == 'Beta'
+    assert index.exact('Alpha')['name'] == 'Alpha // Beta'
+    assert index.exact('Gamma')['name'] == 'Gamma // Alpha'
+    index.close()
+
+
+def test_build_upgrades_an_index_without_ranks(tmp_path):
+    path = str(tmp_path / 'index.sqlite3')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE cards (key TEXT PRIMARY KEY, name TEXT NOT NULL, card TEXT NOT NULL)')
+    connection.commit()
+    connection.close()
+
+    index = card_index.CardIndex(path)
+    assert index.build(ORACLE_CARDS) == 8
+    assert index.exact('Ice')['name'] == 'Fire // Ice'
+    index.close()
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+import cube_registry
+import game_log
+
+CUBE_TEXT = "2 Black Lotus\nLightning Bolt\n"
+
+
+def test_cube_is_parsed_once_per_hash(tmp_path):
+    registry = cube_registry.CubeRegistry(str(tmp_path))
+    cube = registry.register(CUBE_TEXT)
+
+    assert registry.register(CUBE_TEXT) is cube
+    assert registry.get(cube.cube_hash) is cube
+    assert len(cube) == 3
+    assert cube.uniqueNames() == ['Black Lotus', 'Lightning Bolt']
+    assert os.path.exists(registry.path(cube.cube_hash))
+
+
+def test_bundle_drops_cards_past_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cube_registry.time, 'time', lambda: now[0])
+    cube = cube_registry.Cube(CUBE_TEXT)
+    cube.bundle['Black Lotus'] = ({'name': 'Black Lotus'}, 900.0)
+    cube.bundle['Lightning Bolt'] = ({'name': 'Lightning Bolt'}, 990.0)
+
+    assert set(cube.bundled(['Black Lotus', 'Lightning Bolt'], ttl=50)) == {'Lightning Bolt'}
+    assert 'Black Lotus' not in cube.bundle
+    assert set(cube.bundled(['Lightning Bolt', 'Counterspell'])) == {'Lightning Bolt'}
+
+    now[0] += 50
+    assert cube.bundled(['Lightning Bolt'], ttl=50) == {}
+
+
+def test_prune_keeps_logged_and_loaded_cubes(tmp_path):
+    registry = cube_registry.CubeRegistry(str(tmp_path / 'cubes'), capacity=1)
+    logged = registry.register("Counterspell\n")
+    unused = registry.register("Dark Ritual\n")
+    loaded = registry.register(CUBE_TEXT)
+
+    game_log.GameLog.create(str(tmp_path / 'games' / 'archive' / 'old.log'), {'seed': 1, 'cube_hash': logged.cube_hash})
+    (tmp_path / 'games' / 'broken.log').write_bytes(b'not a header\n')
+    kept = game_log.loggedCubes([str(tmp_path / 'games'), str(tmp_path / 'games' / 'archive')])
+
+    assert kept == {logged.cube_hash}
+    assert registry.prune(keep=kept) == 1
+    assert not os.path.exists(registry.path(unused.cube_hash))
+    assert os.path.exists(registry.path(logged.cube_hash))
+    assert os.path.exists(registry.path(loaded.cube_hash))
+    assert cube_registry.CubeRegistry(str(tmp_path / 'missing')).prune() == 0
+
+
+def test_parse_cube_reports_malformed_lines():
+    assert cube_registry.parseCube(["2 Island", "Black Lotus", "", "ignored"]) == ['Island', 'Island', 'Black Lotus']
+
+    with pytest.raises(cube_registry.CubeListError) as error:
+        cube_registry.parseCube(["Black Lotus", "4", "0 Island", f"{cube_registry.MAX_QUANTITY + 1} Island", "100000000 Island"])
+
+    assert [number for number, _ in error.value.lines] == [2, 3, 4, 5]
+    assert error.value.lines[0] == (2, '4')
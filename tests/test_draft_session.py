@@ -0,0 +1,171 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import card_cache
+import cube_registry
+from draft_session import QueueClosed, SessionManager, TaskQueue
+from draft_state import Action
+
+CUBE_TEXT = "\n".join(f"Card {index}" for index in range(30))
+
+
+class OfflineFetcher:
+    async def fetch_card(self, name, fuzzy=True):
+        return {'name': name}
+
+    async def fetch_collection(self, names, fuzzy_fallback=True):
+        return {name: {'name': name} for name in names}
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    # Finished and closed games are archived under the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cube_registry, '_shared_registry', cube_registry.CubeRegistry(str(tmp_path / 'cubes')))
+    card_store = card_cache.PersistentCardCache(str(tmp_path / 'cards.sqlite3'))
+    yield SessionManager(fetcher=OfflineFetcher(), card_store=card_store)
+    card_store.close()
+
+
+def start_session(manager, log_dir, session_id=10):
+    session = manager.create(session_id, 1)
+    session.cube = manager.cubes.register(CUBE_TEXT)
+    session.player_one_member = SimpleNamespace(id=100)
+    session.player_two_member = SimpleNamespace(id=200)
+    session.startGame(log_dir=str(log_dir))
+    return session
+
+
+def test_task_queue_runs_jobs_in_order():
+    ran = []
+
+    async def run():
+        queue = TaskQueue()
+
+        def job(index, delay):
+            async def work():
+                await asyncio.sleep(delay)
+                ran.append(index)
+                return index
+            return work
+
+        results = await asyncio.gather(*(queue.submit(job(index, 0.01 * (3 - index))) for index in range(3)))
+        await queue.close()
+        return results
+
+    assert asyncio.run(run()) == [0, 1, 2]
+    assert ran == [0, 1, 2]
+
+
+def test_task_queue_passes_errors_on():
+    async def fail():
+        raise ValueError('bad move')
+
+    async def succeed():
+        return 'ok'
+
+    async def run():
+        queue = TaskQueue()
+        try:
+            with pytest.raises(ValueError):
+                await queue.submit(fail)
+            # The worker keeps going after a failed job
+            assert await queue.submit(succeed) == 'ok'
+        finally:
+            await queue.close()
+
+    asyncio.run(run())
+
+
+def test_closed_task_queue_rejects_jobs():
+    async def run():
+        queue = TaskQueue()
+        blocker = asyncio.Event()
+        running = queue.submit(blocker.wait)
+        waiting = queue.submit(blocker.wait)
+        await asyncio.sleep(0)
+
+        await queue.close()
+
+        assert running.cancelled() and waiting.cancelled()
+        with pytest.raises(QueueClosed):
+            queue.submit(blocker.wait)
+        assert queue._worker is None
+
+    asyncio.run(run())
+
+
+def test_play_rejects_stale_versions(manager, tmp_path):
+    async def run():
+        session = start_session(manager, tmp_path / 'games')
+        version = session.version
+
+        assert session.play(Action.PASS, version)
+        # A second click made on the same position is dropped
+        assert not session.play(Action.TAKE, version)
+        assert len(session.draft.history) == 1
+        assert session.draft.game_log.actions() == [(Action.PASS, 0)]
+
+        assert session.play(Action.TAKE, session.version)
+        assert session.version == version + 2
+        await manager.closeAll()
+
+    asyncio.run(run())
+
+
+def test_play_rejects_moves_after_the_game(manager, tmp_path):
+    async def run():
+        session = start_session(manager, tmp_path / 'games')
+        while session.draft.inProgress():
+            assert session.play(Action.TAKE, session.version)
+
+        assert not session.play(Action.TAKE, session.version)
+        await manager.closeAll()
+
+    asyncio.run(run())
+
+
+def test_unarchived_games_are_restored(manager, tmp_path):
+    log_dir = tmp_path / 'games'
+
+    async def run():
+        session = start_session(manager, log_dir)
+        for action in (Action.PASS, Action.TAKE, Action.PASS):
+            session.play(action, session.version)
+        state = session.draft.state
+        await manager.closeAll(archive=False)
+
+        (restored, players), = await manager.restore(str(log_dir))
+        assert players == [100, 200]
+        assert restored.draft.state == state
+        assert restored.game_started
+        await manager.closeAll()
+
+    asyncio.run(run())
+    assert not [name for name in os.listdir(log_dir) if name.endswith('.log')]
+
+
+def test_unreadable_logs_are_archived_and_the_rest_restored(manager, tmp_path):
+    log_dir = tmp_path / 'games'
+
+    async def run():
+        session = start_session(manager, log_dir)
+        session.play(Action.PASS, session.version)
+        state = session.draft.state
+        await manager.closeAll(archive=False)
+
+        (log_dir / '0-garbage.log').write_bytes(b'\x00\xff not a header')
+        (log_dir / '1-mismatch.log').write_text('{"seed": 1, "cube_hash": "missing", "session_id": 11, "channel_id": 1, "players": [1, 2]}\n')
+
+        (restored, players), = await manager.restore(str(log_dir))
+        assert restored.draft.state == state
+        assert manager.get(11) is None
+        await manager.closeAll()
+
+    asyncio.run(run())
+    archived = os.listdir(log_dir / 'archive')
+    assert sum(name.startswith('0-garbage') for name in archived) == 1
+    assert sum(name.startswith('1-mismatch') for name in archived) == 1
@@ -0,0 +1,166 @@
+import random
+from array import array
+from collections import Counter
+
+import pytest
+
+from cube_registry import CARD_ID_TYPE
+from draft_state import PILE_COUNT, Action, DraftHistory, DraftState
+
+DECK = tuple(range(20))
+
+
+def all_cards(state):
+    cards = Counter(state.deck[:state.remaining])
+    for cards_held in state.piles + state.pulls:
+        cards.update(cards_held)
+    return cards
+
+
+def play_random(state, rng):
+    moves = []
+    while state.legal_actions():
+        action = rng.choice(state.legal_actions())
+        moves.append(action)
+        state = state.apply(action)
+    return state, moves
+
+
+def test_new_deals_one_card_per_pile():
+    state = DraftState.new(DECK, starting_player=1)
+
+    assert [pile.tolist() for pile in state.piles] == [[19], [18], [17]]
+    assert state.remaining == 17
+    assert state.next_card() == 16
+    assert state.current_pile == 0
+    assert state.current_player == state.starting_player == 1
+    assert all(isinstance(cards, array) and cards.typecode == CARD_ID_TYPE for cards in state.piles + state.pulls)
+
+
+def test_take_claims_pile_and_refills_it():
+    state = DraftState.new(DECK)
+    taken = state.apply(Action.TAKE)
+
+    assert taken.pulls[0].tolist() == [19]
+    assert taken.piles[0].tolist() == [16]
+    assert taken.remaining == 16
+    assert taken.current_player == 1
+    assert taken.current_pile == 0
+    # The untouched piles and pulls are shared, the original position is unchanged
+    assert taken.piles[1] is state.piles[1] and taken.pulls[1] is state.pulls[1]
+    assert state.piles[0].tolist() == [19] and not state.pulls[0]
+
+
+def test_pass_grows_pile_then_blind_picks():
+    state = DraftState.new(DECK)
+    state = state.apply(Action.PASS)
+
+    assert state.piles[0].tolist() == [19, 16]
+    assert state.current_pile == 1
+    assert state.current_player == 0
+
+    state = state.apply(Action.PASS).apply(Action.PASS)
+
+    assert [pile.tolist() for pile in state.piles] == [[19, 16], [18, 15], [17, 14]]
+    assert state.pulls[0].tolist() == [13]
+    assert state.current_player == 1
+    assert state.current_pile == 0
+
+
+def test_take_skips_empty_piles():
+    state = DraftState.new((1, 2))
+
+    assert state.piles[2].tolist() == []
+    state = state.apply(Action.PASS).apply(Action.PASS)
+    assert state.current_pile == 2
+    assert state.taken_pile() is None
+
+    # Nothing left to take or draw, the turn just passes
+    state = state.apply(Action.TAKE)
+    assert state.current_player == 1
+    assert state.current_pile == 0
+
+
+def test_legal_actions_and_game_over():
+    state, moves = play_random(DraftState.new(DECK), random.Random(3))
+
+    assert moves
+    assert state.is_over()
+    assert state.legal_actions() == ()
+    with pytest.raises(ValueError):
+        state.apply(Action.TAKE)
+    assert sum(len(pull) for pull in state.pulls) == len(DECK)
+
+
+def test_cards_are_conserved():
+    rng = random.Random(7)
+    state = DraftState.new(DECK)
+    while state.legal_actions():
+        state = state.apply(rng.choice(state.legal_actions()))
+        assert all_cards(state) == Counter(DECK)
+
+
+def test_state_is_immutable():
+    state = DraftState.new(DECK)
+
+    with pytest.raises(AttributeError):
+        state.remaining = 0
+
+
+def test_equal_positions_hash_equal():
+    rng = random.Random(11)
+    _, moves = play_random(DraftState.new(DECK), rng)
+
+    first = DraftState.new(DECK)
+    second = DraftState.new(DECK)
+    for action in moves[:10]:
+        first = first.apply(action)
+        second = second.apply(action)
+
+    assert first == second
+    assert hash(first) == hash(second)
+    assert first != DraftState.new(DECK)
+
+
+def test_snapshot_round_trip():
+    state = DraftState.new(DECK)
+    for action in (Action.PASS, Action.TAKE, Action.PASS, Action.PASS, Action.PASS):
+        state = state.apply(action)
+
+    restored = DraftState.from_snapshot(state.deck, state.snapshot())
+
+    assert restored == state
+    assert hash(restored) == hash(state)
+    assert restored.deck is state.deck
+
+
+def test_history_undo_restores_previous_states():
+    history = DraftHistory(DraftState.new(DECK))
+    states = [history.state]
+    for action in (Action.PASS, Action.TAKE, Action.PASS):
+        states.append(history.play(action))
+
+    assert len(history) == 3
+    assert history.undo() == Action.PASS
+    assert history.state is states[2]
+    assert history.undo() == Action.TAKE
+    assert history.undo() == Action.PASS
+    assert history.state is states[0]
+
+    with pytest.raises(IndexError):
+        history.undo()
+
+
+def test_replay_is_deterministic():
+    rng = random.Random(5)
+    deck = list(range(60))
+    rng.shuffle(deck)
+    final, moves = play_random(DraftState.new(deck), rng)
+
+    state = DraftState.new(deck)
+    for action in moves:
+        state = state.apply(action)
+
+    assert state == final
+    assert [pull.tolist() for pull in state.pulls] == [pull.tolist() for pull in final.pulls]
+    assert PILE_COUNT == len(state.piles)
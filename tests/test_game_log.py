@@ -0,0 +1,114 @@
+import asyncio
+import os
+import random
+
+import pytest
+
+import card_cache
+import card_fetcher
+import cube_registry
+import game_log
+from draft_state import PILE_COUNT, Action
+from winston import WinstonDraft
+
+CUBE_TEXT = "\n".join(f"Card {index}" for index in range(45))
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = cube_registry.CubeRegistry(str(tmp_path / 'cubes'))
+    monkeypatch.setattr(cube_registry, '_shared_registry', registry)
+    return registry
+
+
+def make_draft(tmp_path):
+    memory_cache = card_cache.LRUCardCache(capacity=64)
+    memory_cache.update({f"Card {index}": {'name': f"Card {index}"} for index in range(45)})
+    card_store = card_cache.PersistentCardCache(str(tmp_path / 'cards.sqlite3'))
+    return WinstonDraft(fetcher=card_fetcher.CardFetcher(), card_store=card_store, memory_cache=memory_cache)
+
+
+def start_game(draft, registry, path, seed=4):
+    cube = registry.register(CUBE_TEXT)
+    draft.newGame(cube, seed=seed)
+    draft.game_log = game_log.GameLog.create(str(path), {'seed': seed, 'cube_hash': cube.cube_hash})
+
+
+def restored(tmp_path, path):
+    draft = make_draft(tmp_path)
+    draft.restoreGame(game_log.GameLog.load(str(path)))
+    return draft
+
+
+def test_codes_round_trip():
+    for action in Action:
+        for pile in list(range(PILE_COUNT)) + [None]:
+            assert game_log.decodeAction(game_log.encodeAction(action, pile)) == (action, pile)
+
+    assert game_log.decodeAction(game_log._UNDO) == (None, None)
+
+
+def test_restore_replays_from_snapshot(tmp_path, registry):
+    path = tmp_path / 'games' / 'session.log'
+    draft = make_draft(tmp_path)
+    rng = random.Random(1)
+
+    async def play():
+        start_game(draft, registry, path)
+        for _ in range(game_log.SNAPSHOT_INTERVAL + 5):
+            draft.applyAction(rng.choice((Action.TAKE, Action.PASS)))
+
+        again = restored(tmp_path, path)
+        assert again.state == draft.state
+        assert again.game_log.readSnapshot(draft.state.deck)[0] == game_log.SNAPSHOT_INTERVAL
+        # Only the moves after the snapshot are left to undo
+        assert len(again.history) == 5
+        await again.close()
+        await draft.close()
+
+    asyncio.run(play())
+    assert os.path.exists(f'{path}.snapshot')
+
+
+def test_undos_do_not_count_towards_snapshots(tmp_path, registry):
+    path = tmp_path / 'session.log'
+    draft = make_draft(tmp_path)
+
+    async def play():
+        start_game(draft, registry, path)
+        for _ in range(game_log.SNAPSHOT_INTERVAL // 2):
+            draft.applyAction(Action.PASS)
+        for _ in range(game_log.SNAPSHOT_INTERVAL // 2):
+            draft.undo()
+        assert len(draft.game_log) == game_log.SNAPSHOT_INTERVAL
+        await draft.close()
+
+    asyncio.run(play())
+    assert not os.path.exists(f'{path}.snapshot')
+
+
+def test_undo_across_snapshot_replays_from_seed(tmp_path, registry):
+    path = tmp_path / 'session.log'
+    draft = make_draft(tmp_path)
+
+    async def play():
+        start_game(draft, registry, path)
+        for _ in range(game_log.SNAPSHOT_INTERVAL):
+            draft.applyAction(Action.PASS)
+        draft.undo()
+
+        again = restored(tmp_path, path)
+        assert again.state == draft.state
+
+        for _ in range(3):
+            draft.applyAction(Action.TAKE)
+        for _ in range(6):
+            draft.undo()
+
+        again = restored(tmp_path, path)
+        assert again.state == draft.state
+        assert len(again.history) == len(draft.history)
+        await again.close()
+        await draft.close()
+
+    asyncio.run(play())
@@ -0,0 +1,26 @@
+import metrics
+
+
+def test_counter_read_from_callback_is_exported_as_counter():
+    registry = metrics.Registry()
+    hits = [3]
+    registry.counter('cache_hits_total', 'Cache hits', function=lambda: hits[0])
+    registry.gauge('cache_hit_ratio', 'Cache hit ratio', function=lambda: 0.75)
+
+    hits[0] += 1
+    lines = registry.render().splitlines()
+
+    assert '# TYPE cache_hits_total counter' in lines
+    assert 'cache_hits_total 4' in lines
+    assert '# TYPE cache_hit_ratio gauge' in lines
+    assert 'cache_hit_ratio 0.75' in lines
+
+
+def test_labelled_counter():
+    registry = metrics.Registry()
+    moves = registry.counter('moves_total', 'Moves', ('action',))
+    moves.inc(action='take')
+    moves.inc(2, action='take')
+
+    assert moves.value(action='take') == 3
+    assert 'moves_total{action="take"} 3' in registry.render().splitlines()
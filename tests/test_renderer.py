@@ -0,0 +1,113 @@
+import asyncio
+import random
+from array import array
+
+import card_cache
+import card_fetcher
+from cube_registry import CARD_ID_TYPE, CardTable, Cube
+from draft_state import Action
+from winston import CardListRenderer, WinstonDraft
+
+NAMES = ['Black Lotus', 'Lightning Bolt', 'Counterspell', 'Swords to Plowshares', 'Dark Ritual']
+
+
+def card(name):
+    return {'name': name, 'scryfall_uri': f'https://scryfall.com/{name}'}
+
+
+def make_renderer():
+    table = CardTable(NAMES)
+    resolved = []
+
+    async def resolve(name):
+        resolved.append(name)
+        return card(name)
+
+    return CardListRenderer(table.namesOf, resolve), resolved
+
+
+def ids(*card_ids):
+    return array(CARD_ID_TYPE, card_ids)
+
+
+def test_render_extends_with_new_cards_only():
+    renderer, resolved = make_renderer()
+
+    async def run():
+        first = ids(0, 1)
+        text = await renderer.render('pulls', first)
+        assert await renderer.render('pulls', first) == text
+        assert renderer.version('pulls') == 1
+
+        longer = first + ids(2)
+        extended = await renderer.render('pulls', longer)
+        return text, extended
+
+    text, extended = asyncio.run(run())
+
+    assert extended.startswith(text)
+    assert extended.count('\n- ') == 3
+    assert 'Counterspell' in extended
+    # Each card was resolved once, the cached prefix wasn't touched again
+    assert resolved == NAMES[:3]
+    assert renderer.version('pulls') == 2
+
+
+def test_reset_rebuilds_a_replaced_list():
+    renderer, _ = make_renderer()
+
+    async def run():
+        await renderer.render(('pile', 0), ids(0, 1, 2))
+        renderer.reset(('pile', 0))
+        return await renderer.render(('pile', 0), ids(3, 4, 1, 2))
+
+    text = asyncio.run(run())
+
+    assert 'Black Lotus' not in text
+    assert text.index('Swords to Plowshares') < text.index('Dark Ritual') < text.index('Lightning Bolt')
+    assert renderer.version(('pile', 0)) == 3
+
+
+def test_shorter_list_starts_over():
+    renderer, _ = make_renderer()
+
+    async def run():
+        await renderer.render('pulls', ids(0, 1, 2))
+        return await renderer.render('pulls', ids(4))
+
+    text = asyncio.run(run())
+
+    assert text.count('\n- ') == 1 and 'Dark Ritual' in text
+
+
+def full_render(draft, card_ids):
+    return "".join("\n- [" + name + "](" + card(name)['scryfall_uri'] + ")" for name in draft.cardNames(card_ids))
+
+
+def test_incremental_render_matches_full_render(tmp_path):
+    cube_text = "\n".join(f"{index % 7 + 1} Card {index}" for index in range(30))
+    names = {f"Card {index}" for index in range(30)}
+    memory_cache = card_cache.LRUCardCache(capacity=64)
+    memory_cache.update({name: card(name) for name in names})
+    card_store = card_cache.PersistentCardCache(str(tmp_path / 'cards.sqlite3'))
+    draft = WinstonDraft(fetcher=card_fetcher.CardFetcher(), card_store=card_store, memory_cache=memory_cache)
+    rng = random.Random(2)
+
+    async def play():
+        draft.newGame(Cube(cube_text), seed=9)
+        while draft.inProgress():
+            if len(draft.history) and rng.random() < 0.2:
+                draft.undo()
+            else:
+                draft.applyAction(rng.choice((Action.TAKE, Action.PASS)))
+
+            for pile in range(3):
+                rendered = await draft.renderer.render(('pile', pile), draft.piles[pile])
+                assert rendered == full_render(draft, draft.piles[pile])
+            for player in range(2):
+                rendered = await draft.renderer.render(('pulls', player), draft.state.pulls[player])
+                assert rendered == full_render(draft, draft.state.pulls[player])
+        await draft.close()
+
+    asyncio.run(play())
+    card_store.close()
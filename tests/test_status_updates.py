@@ -0,0 +1,48 @@
+import asyncio
+
+from status_updates import UpdateScheduler
+
+
+def recorder(sent):
+    async def send(payload):
+        sent.append(payload)
+    return send
+
+
+def build(payload):
+    async def build():
+        return payload
+    return build
+
+
+def test_updates_inside_the_window_become_one_edit():
+    sent = []
+
+    async def run():
+        scheduler = UpdateScheduler(debounce=0.05)
+        for payload in ('first', 'second', 'latest'):
+            scheduler.schedule('status', build(payload), recorder(sent))
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+
+        # Nothing changed since, so the next update isn't sent
+        scheduler.schedule('status', build('latest'), recorder(sent))
+        await asyncio.sleep(0.1)
+        await scheduler.close()
+        return scheduler.shown('status')
+
+    assert asyncio.run(run()) == 'latest'
+    assert sent == ['latest']
+
+
+def test_close_drops_pending_updates():
+    sent = []
+
+    async def run():
+        scheduler = UpdateScheduler(debounce=0.05)
+        scheduler.schedule('status', build('pending'), recorder(sent))
+        await scheduler.close()
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert sent == []
@@ -0,0 +1,43 @@
+import asyncio
+
+import card_cache
+from cube_registry import Cube
+from winston import WinstonDraft
+
+CUBE_TEXT = "\n".join(f"Card {index}" for index in range(30))
+
+
+class CollectionOutageFetcher:
+    # Collection requests fail, single card lookups work
+    def __init__(self) -> None:
+        self.fetched = []
+
+    async def fetch_collection(self, names, fuzzy_fallback=True):
+        return {}
+
+    async def fetch_card(self, name, fuzzy=True):
+        self.fetched.append(name)
+        return {'name': name, 'scryfall_uri': f'https://scryfall.com/{name}'}
+
+
+def test_lookahead_resumes_after_a_failed_warmup(tmp_path):
+    fetcher = CollectionOutageFetcher()
+    card_store = card_cache.PersistentCardCache(str(tmp_path / 'cards.sqlite3'))
+    draft = WinstonDraft(fetcher=fetcher, card_store=card_store, memory_cache=card_cache.LRUCardCache(), lookahead=4)
+
+    async def play():
+        draft.newGame(Cube(CUBE_TEXT), seed=3)
+        assert draft.card_warmup_names
+        await draft.card_warmup
+        for _ in range(10):
+            await asyncio.sleep(0.01)
+
+        assert not draft.card_warmup_names
+        # The piles on show and the next draws were looked up once the warmup gave up
+        assert len(fetcher.fetched) >= 7
+        for pile in draft.piles:
+            assert all(name in draft.card_cache for name in draft.cardNames(pile))
+        await draft.close()
+
+    asyncio.run(play())
+    card_store.close()
@@ -0,0 +1,214 @@
+import asyncio
+import itertools
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+import card_cache
+import cube_registry
+import winston_bot
+from draft_session import SessionManager
+
+CUBE_TEXT = "\n".join(f"Card {index}" for index in range(30))
+
+_ids = itertools.count(1000)
+
+
+class OfflineFetcher:
+    async def fetch_card(self, name, fuzzy=True):
+        return {'name': name, 'scryfall_uri': f'https://scryfall.com/{name}'}
+
+    async def fetch_collection(self, names, fuzzy_fallback=True):
+        return {name: {'name': name, 'scryfall_uri': f'https://scryfall.com/{name}'} for name in names}
+
+
+class FakeMessage:
+    def __init__(self, channel, content=None, **kwargs) -> None:
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.kwargs = kwargs
+
+    async def edit(self, **kwargs):
+        self.kwargs.update(kwargs)
+
+
+class FakeThread:
+    def __init__(self) -> None:
+        self.id = next(_ids)
+        self.messages = []
+
+    async def send(self, content=None, **kwargs):
+        message = FakeMessage(self, content, **kwargs)
+        self.messages.append(message)
+        return message
+
+
+class FakeResponse:
+    def __init__(self) -> None:
+        self.done = False
+        self.sent = []
+
+    def is_done(self):
+        return self.done
+
+    async def defer(self, **kwargs):
+        self.done = True
+
+    async def send_message(self, content=None, **kwargs):
+        self.done = True
+        self.sent.append(content)
+
+
+class FakeFollowup:
+    def __init__(self, channel) -> None:
+        self.channel = channel
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+        return FakeMessage(self.channel, content, **kwargs)
+
+
+class FakeInteraction:
+    def __init__(self, user, channel) -> None:
+        self.user = user
+        self.channel = channel
+        self.extras = {}
+        self.created_at = discord.utils.utcnow()
+        self.response = FakeResponse()
+        self.followup = FakeFollowup(channel)
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cube_registry, '_shared_registry', cube_registry.CubeRegistry(str(tmp_path / 'cubes')))
+    card_store = card_cache.PersistentCardCache(str(tmp_path / 'cards.sqlite3'))
+    manager = SessionManager(fetcher=OfflineFetcher(), card_store=card_store, status_debounce=0.01)
+    monkeypatch.setattr(winston_bot.bot, 'sessions', manager)
+    yield manager
+    card_store.close()
+
+
+async def start_game(manager):
+    thread = FakeThread()
+    session = manager.create(thread.id, next(_ids))
+    session.thread = thread
+    session.cube = manager.cubes.register(CUBE_TEXT)
+    session.player_one_member = SimpleNamespace(id=next(_ids), mention='<@1>')
+    session.player_two_member = SimpleNamespace(id=next(_ids), mention='<@2>')
+    await winston_bot.new_game(thread, session)
+    return thread, session
+
+
+def test_second_click_on_the_same_buttons_is_dropped(manager):
+    async def run():
+        thread, session = await start_game(manager)
+        view = session.status_message.kwargs['view']
+        member = session.current_player_member
+        stale = winston_bot.stale_moves.value(action='PASS')
+
+        await view.pass_button.callback(FakeInteraction(member, thread))
+        await asyncio.sleep(0.15)
+        await view.pass_button.callback(FakeInteraction(member, thread))
+
+        assert len(session.draft.history) == 1
+        assert winston_bot.stale_moves.value(action='PASS') == stale + 1
+
+        # The status edit sends buttons for the new position, those play
+        new_view = session.status_message.kwargs['view']
+        assert new_view is not view and new_view.version == session.version
+        await new_view.pass_button.callback(FakeInteraction(session.current_player_member, thread))
+
+        assert len(session.draft.history) == 2
+        await manager.closeAll()
+
+    asyncio.run(run())
+
+
+def test_malformed_cube_list_lines_are_reported_by_number(manager):
+    async def run():
+        session = manager.create(next(_ids), next(_ids))
+        modal = winston_bot.FileModal(session)
+        modal.file_contents._value = "Black Lotus\n4\n100000000 Island"
+        interaction = FakeInteraction(SimpleNamespace(id=1), FakeThread())
+
+        await modal.on_submit(interaction)
+
+        message, = interaction.response.sent
+        assert message.startswith(winston_bot.bot.game_quotes["CardListMalformed"][0])
+        assert "- Line 2: `4`" in message
+        assert "- Line 3: `100000000 Island`" in message
+        assert session.cube is None
+        await manager.closeAll()
+
+    asyncio.run(run())
+
+
+def test_failed_start_can_be_retried(manager):
+    async def run():
+        thread = FakeThread()
+        session = manager.create(thread.id, next(_ids), draft_file='missing-cube.txt')
+        session.player_one_member = SimpleNamespace(id=next(_ids), mention='<@1>')
+        session.player_two_member = SimpleNamespace(id=next(_ids), mention='<@2>')
+
+        await winston_bot.new_game(thread, session)
+
+        assert not session.game_started
+        assert thread.messages[-1].content == winston_bot.bot.game_quotes["GameStartError"][0]
+
+        session.cube = manager.cubes.register(CUBE_TEXT)
+        await winston_bot.new_game(thread, session)
+
+        assert session.game_started
+        assert session.status_message is not None
+        await manager.closeAll()
+
+    asyncio.run(run())
+
+
+def snowflake(age):
+    return discord.utils.time_snowflake(datetime.now(timezone.utc) - age)
+
+
+def test_message_batches_bulk_delete_recent_messages_only():
+    recent = [snowflake(timedelta(minutes=minutes)) for minutes in range(250)]
+    old = [snowflake(timedelta(days=15)), snowflake(timedelta(days=30))]
+
+    batches = list(winston_bot.message_batches(old[:1] + recent + old[1:]))
+
+    assert [len(batch) for batch in batches] == [100, 100, 50, 1, 1]
+    assert sorted(sum(batches[:3], [])) == sorted(recent)
+    assert batches[3:] == [old[:1], old[1:]]
+
+
+class FakeChannel:
+    def __init__(self, missing=()) -> None:
+        self.id = next(_ids)
+        self.missing = set(missing)
+        self.bulk_deletes = 0
+        self.deleted = []
+
+    async def delete_messages(self, messages):
+        self.bulk_deletes += 1
+        raise discord.Forbidden(SimpleNamespace(status=403, reason='Forbidden'), 'Missing Permissions')
+
+    def get_partial_message(self, message_id):
+        async def delete():
+            if message_id in self.missing:
+                raise discord.NotFound(SimpleNamespace(status=404, reason='Not Found'), 'Unknown Message')
+            self.deleted.append(message_id)
+        return SimpleNamespace(delete=delete)
+
+
+def test_delete_messages_falls_back_to_single_deletes_without_permission():
+    channel = FakeChannel(missing=[2])
+
+    asyncio.run(winston_bot.delete_messages(channel, [1, 2, 3]))
+
+    assert channel.bulk_deletes == 1
+    # A message someone already deleted doesn't stop the rest
+    assert channel.deleted == [1, 3]
@@ -0,0 +1,86 @@
+import random
+from collections import Counter
+
+import numpy as np
+
+import winston_sim
+from draft_state import Action, DraftState
+
+CARD_COUNT = 30
+
+
+def play(deck, starting_player, choose):
+    # Plays a game with DraftState, returns the numbers the simulator reports per game
+    state = DraftState.new(deck, starting_player)
+    moves = blind_picks = 0
+    taken_sizes = []
+    while state.legal_actions():
+        moves += 1
+        action = choose()
+        if action == Action.TAKE and state.taken_pile() is not None:
+            taken_sizes.append(len(state.piles[state.taken_pile()]))
+        pulled = sum(map(len, state.pulls))
+        previous = state
+        state = state.apply(action)
+        if action == Action.PASS and previous.current_pile == 2 and sum(map(len, state.pulls)) > pulled:
+            blind_picks += 1
+
+    return state, moves, blind_picks, taken_sizes
+
+
+def test_always_take_matches_draft_state():
+    cube_ids = np.arange(CARD_COUNT, dtype=np.int32)
+    seed = 12
+    result = winston_sim.simulateBatch(cube_ids, 1, card_limit=CARD_COUNT, take_probability=1.0, seed=seed)
+
+    # The same deck and starting player the simulator drew
+    rng = np.random.default_rng(seed)
+    deck = rng.permuted(np.tile(cube_ids, (1, 1)), axis=1)[0, :CARD_COUNT]
+    starting_player = int(rng.integers(0, 2, size=1, dtype=np.int8)[0])
+
+    state, moves, blind_picks, taken_sizes = play(deck.tolist(), starting_player, lambda: Action.TAKE)
+
+    assert result['unfinished'] == 0
+    assert np.flatnonzero(result['moves']).tolist() == [moves]
+    assert np.flatnonzero(result['blind_picks']).tolist() == [blind_picks]
+    assert result['taken_pile_sizes'].tolist() == np.bincount(taken_sizes, minlength=winston_sim.MAX_PILE_SIZE + 1).tolist()
+    assert np.flatnonzero(result['starting_player_pool']).tolist() == [len(state.pulls[starting_player])]
+    assert np.flatnonzero(result['second_player_pool']).tolist() == [len(state.pulls[1 - starting_player])]
+
+    pulled = Counter(card for pull in state.pulls for card in pull)
+    assert result['card_taken'].tolist() == [pulled[card] for card in range(CARD_COUNT)]
+
+
+def test_random_play_statistics_match_draft_state():
+    games = 600
+    cube_ids = np.arange(CARD_COUNT, dtype=np.int32)
+    result = winston_sim.simulateBatch(cube_ids, 20 * games, card_limit=CARD_COUNT, seed=4)
+
+    rng = random.Random(4)
+    moves, blind_picks, taken_sizes = [], [], []
+    for _ in range(games):
+        deck = list(range(CARD_COUNT))
+        rng.shuffle(deck)
+        _, game_moves, game_blind_picks, game_taken_sizes = play(
+            deck, rng.randrange(2), lambda: rng.choice((Action.TAKE, Action.PASS))
+        )
+        moves.append(game_moves)
+        blind_picks.append(game_blind_picks)
+        taken_sizes.extend(game_taken_sizes)
+
+    assert result['unfinished'] == 0
+    assert abs(winston_sim._mean(result['moves']) - np.mean(moves)) < 0.05 * np.mean(moves)
+    assert abs(winston_sim._mean(result['blind_picks']) - np.mean(blind_picks)) < 0.1 * np.mean(blind_picks) + 0.05
+    assert abs(winston_sim._mean(result['taken_pile_sizes']) - np.mean(taken_sizes)) < 0.05 * np.mean(taken_sizes)
+    # Every dealt card ends up with a player
+    assert (result['card_taken'] + result['card_blind_picked']).tolist() == result['card_dealt'].tolist()
+
+
+def test_card_ids_past_int16_stay_positive(tmp_path):
+    cube = tmp_path / 'cube.txt'
+    cube.write_text("\n".join(f"Card {index}" for index in range(32770)), encoding='utf-8')
+
+    names, cube_ids = winston_sim.loadCubeIds(str(cube))
+
+    assert len(names) == 32770
+    assert cube_ids.min() == 0 and cube_ids.max() == 32769
@@ -1,247 +1,386 @@
 import asyncio
 import random
 import enum
+import logging
 import time
-import concurrent.futures
+import card_cache
 import card_fetcher
+from cube_registry import Cube, get_registry, parseCube
+from draft_state import Action, DraftHistory, DraftState, PILE_COUNT
 
+logger = logging.getLogger(__name__)
 
-class Players(enum.Enum):
-    PLAYER_ONE = 1
-    PLAYER_TWO = 2
+# How many of the next cards to be drawn are resolved ahead of time
+DEFAULT_LOOKAHEAD = 12
 
+# Pull list pages stay under Discord's 2000 character message limit
+PULLS_PAGE_SIZE = 10
+COMPACT_PULLS_PAGE_SIZE = 40
 
-class DraftPile:
-    def __init__(self, file_path, card_limit=90) -> None:
-        self.draft_pile = (
-            self.loadCube() if file_path is None else self.loadCube(file_path)
-        )
-
-        self.shuffle()
-        self.enforceCardLimit(card_limit)
-        
-    
-    def enforceCardLimit(self, max_cards = 60):
-        if len(self.draft_pile) > max_cards:
-            self.draft_pile = self.draft_pile[:max_cards]
-            pass    
 
-    def getNextCard(self):
-        if self.isEmpty():
-            print("Draft pile is empty")
-            return None
+class Players(enum.Enum):
+    PLAYER_ONE = 1
+    PLAYER_TWO = 2
 
-        return self.draft_pile.pop()
 
-    def isEmpty(self):
-        return not self.draft_pile
+def cardLink(card_name, card_info):
+    if card_info:
+        return f"[{card_name}]({card_info['scryfall_uri']})"
 
-    def cardsRemaining(self):
-        return len(self.draft_pile)
+    return f"[{card_name}]<URL Not Found>"
 
-    def loadCube(self, file_path):
 
-        cube = []
+class CardListRenderer:
+    # Rendered markdown for each pile and pull list. Between resets a list only grows,
+    # so the cards past the cached length are the new ones and a cached fragment is
+    # extended with just those instead of being rebuilt. The owner resets a list that
+    # was replaced (a taken pile) and every list after an undo. Every change bumps
+    # the list's version.
 
-        with open(file_path) as infile:
+    __slots__ = ("card_names", "resolve", "fragments", "versions", "card_lines")
 
-            for line in infile:
+    def __init__(self, card_names, resolve) -> None:
+        self.card_names = card_names
+        self.resolve = resolve
+        self.fragments = {}
+        self.versions = {}
+        self.card_lines = {}
 
-                if not line.strip():
-                    break
+    def version(self, key):
+        return self.versions.get(key, 0)
 
-                values = line.split(maxsplit=1)
-                quantity = 0
-                name = ""
-                if not values[0].isnumeric():
-                    quantity = 1
-                    name = ' '.join(values).strip()
-                else:
-                    quantity = int(values[0])
-                    name = values[1].strip()
+    def clear(self):
+        # Card ids are only meaningful within one game
+        self.fragments = {}
+        self.versions = {}
 
-                for i in range(quantity):
-                    cube.append(name)
+    def reset(self, key=None):
+        # Drops the fragment of a list that didn't just grow, every list when key is None
+        for reset_key in list(self.fragments) if key is None else [key]:
+            if self.fragments.pop(reset_key, None) is not None:
+                self.versions[reset_key] = self.version(reset_key) + 1
 
-        return cube
+    async def cardLines(self, names):
+        # One markdown line per name, cards not rendered before are resolved together
+        lines = self.card_lines
+        missing = [name for name in dict.fromkeys(names) if name not in lines]
+        if missing:
+            lines = dict(lines)
+            for name, card in zip(missing, await asyncio.gather(*map(self.resolve, missing))):
+                lines[name] = "\n- " + cardLink(name, card)
+                #Cards that weren't found are tried again next time
+                if card:
+                    self.card_lines[name] = lines[name]
 
-    def shuffle(self):
-        random.shuffle(self.draft_pile)
+        return [lines[name] for name in names]
 
-    def sample(self, size=5):
-        return self.draft_pile[:size] if size > 0 else self.draft_pile[: size - 1 : -1]
+    async def render(self, key, card_ids):
+        cards, count, text = self.fragments.get(key, (None, 0, ""))
+        if card_ids is cards:
+            return text
 
+        # Shorter than what was rendered means a reset was missed, start over
+        rebuilt = len(card_ids) < count
+        if rebuilt:
+            count, text = 0, ""
 
-class PickPiles:
+        added = card_ids[count:]
+        if added:
+            text += "".join(await self.cardLines(self.card_names(added)))
 
-    class Piles(enum.Enum):
-        PILE_ONE = 1
-        PILE_TWO = 2
-        PILE_THREE = 3
+        if added or rebuilt:
+            self.versions[key] = self.version(key) + 1
+        self.fragments[key] = (card_ids, len(card_ids), text)
+        return text
 
-    def __init__(self, draft_pile) -> None:
-        self.draft_pile = draft_pile
 
-        self.pile_one = []
-        self.pile_two = []
-        self.pile_three = []
+class DraftPile:
 
-        self.pick_piles = {
-            self.Piles.PILE_ONE: self.pile_one,
-            self.Piles.PILE_TWO: self.pile_two,
-            self.Piles.PILE_THREE: self.pile_three,
-        }
+    # One game's shuffled view of a registered cube: the card table is the cube's,
+    # only the draw order is copied
 
-        self.current_pile = self.Piles.PILE_ONE
+    __slots__ = ("cube", "cards", "draft_pile")
 
-    def getCurrentPile(self):
+    def __init__(self, cube, card_limit=90, rng=random) -> None:
+        if not isinstance(cube, Cube):
+            cube = get_registry().load(cube)
 
-        if self.current_pile not in self.pick_piles.keys():
-            raise Exception(f"Current pile is invalid: {self.current_pile}\n")
+        self.cube = cube
+        self.cards = cube.cards
+        self.draft_pile = cube.ids()
 
-        return self.pick_piles[self.current_pile]
+        self.shuffle(rng)
+        self.enforceCardLimit(card_limit)
+        
+    
+    def enforceCardLimit(self, max_cards = 60):
+        if len(self.draft_pile) > max_cards:
+            self.draft_pile = self.draft_pile[:max_cards]
+            pass    
 
-    def moveToNextPile(self):
-        if self.current_pile == self.Piles.PILE_ONE:
-            self.current_pile = self.Piles.PILE_TWO
-        elif self.current_pile == self.Piles.PILE_TWO:
-            self.current_pile = self.Piles.PILE_THREE
-        elif self.current_pile == self.Piles.PILE_THREE:
-            self.current_pile = self.Piles.PILE_ONE
-        else:
-            IndexError(f"Current pile is invalid: {self.current_pile}")
+    parseCube = staticmethod(parseCube)
 
-    def setToFirstPile(self):
-        self.current_pile = self.Piles.PILE_ONE
+    def shuffle(self, rng=random):
+        rng.shuffle(self.draft_pile)
 
-    def addCardToCurrentPile(self):
-        next_card = self.draft_pile.getNextCard()
-        if next_card:
-            self.getCurrentPile().append(next_card)
+    def uniqueCards(self):
+        # Distinct card names in draw order
+        return self.cards.namesOf(dict.fromkeys(reversed(self.draft_pile)))
 
-    def clearCurrentPile(self):
-        self.getCurrentPile().clear()
 
-    def isLastPile(self):
-        return self.current_pile == self.Piles.PILE_THREE
-    
-    def allPilesEmpty(self):
-        for pile in self.pick_piles.values():
-            if pile:
-                return False
+class WinstonDraft:
 
-        return True
+    # Game rules live in draft_state.DraftState, this keeps the current position
+    # and its history and resolves the cards it shows
+
+    __slots__ = (
+        "fetcher", "card_store", "prefetcher", "card_cache", "card_warmup", "card_warmup_names",
+        "lookahead", "renderer", "pile_view", "draft_pile", "history", "starting_player", "seed", "game_log",
+    )
+
+    def __init__(
+        self,
+        fetcher=None,
+        card_store=None,
+        cache_capacity=card_cache.DEFAULT_CAPACITY,
+        memory_cache=None,
+        lookahead=DEFAULT_LOOKAHEAD,
+    ) -> None:
+
+        self.fetcher = fetcher if fetcher else card_fetcher.get_fetcher()
+        self.card_store = card_store if card_store else card_cache.get_card_store()
+        self.prefetcher = card_fetcher.CardPrefetcher(self.resolveCard)
+        self.card_cache = memory_cache if memory_cache is not None else card_cache.LRUCardCache(capacity=cache_capacity)
+        self.card_warmup = None
+        self.card_warmup_names = set()
+        self.lookahead = lookahead
+        self.renderer = CardListRenderer(self.cardNames, self.getScryfallCard)
+        self.pile_view = None
+        self.game_log = None
+
+    @property
+    def state(self):
+        return self.history.state
+
+    @property
+    def current_player(self):
+        return Players(self.state.current_player + 1)
+
+    @property
+    def current_pile(self):
+        return self.state.current_pile
+
+    @property
+    def piles(self):
+        return self.state.piles
+
+    @property
+    def player_pulls(self):
+        return {Players.PLAYER_ONE: self.state.pulls[0], Players.PLAYER_TWO: self.state.pulls[1]}
 
+    def cardsRemaining(self):
+        return self.state.cards_remaining()
 
-class WinstonDraft:
-    def __init__(self) -> None:
+    def inProgress(self):
+        return not self.state.is_over()
 
-        self.thread_pool = concurrent.futures.ThreadPoolExecutor()   
-        self.card_thread = {}     
-        self.card_cache = {}
+    def newGame(self, cube, seed=None):
+        #`cube` is a registered Cube or the path of a cube list
+        #Everything random about a game comes from its seed, so it can be dealt again exactly
+        self.seed = random.getrandbits(64) if seed is None else seed
+        rng = random.Random(self.seed)
 
-    def in_progress(self):
-        return not (self.draft_pile.isEmpty() and self.pick_piles.allPilesEmpty())
+        self.chooseStartingPlayer(rng)
+        self.draft_pile = DraftPile(cube, rng=rng)
+        self.renderer.clear()
+        self.pile_view = None
+        self.warmCardCache()
 
-    def new_game(self, card_list_file_path):
-        self.chooseStartingPlayer()
-        self.draft_pile = DraftPile(card_list_file_path)
-        self.pick_piles = PickPiles(self.draft_pile)
-        
         #Initialize piles
-        next_card = self.getNextCard()
-        if next_card:
-            self.pick_piles.pile_one.append(next_card)
-            
-        next_card = self.getNextCard()
-        if next_card:
-            self.pick_piles.pile_two.append(next_card)
-
-        next_card = self.getNextCard()
-        if next_card:
-            self.pick_piles.pile_three.append(next_card)
-
-        #Initialize player pulls
-        self.player_pulls = {Players.PLAYER_ONE: [], Players.PLAYER_TWO: []}
-
-    def chooseStartingPlayer(self):
-        self.starting_player = random.choice([Players.PLAYER_ONE, Players.PLAYER_TWO])
-        self.current_player = self.starting_player
-
-    def switchPlayer(self):
-        if self.current_player == Players.PLAYER_ONE:
-            self.current_player = Players.PLAYER_TWO
-
-        elif self.current_player == Players.PLAYER_TWO:
-            self.current_player = Players.PLAYER_ONE
-        else:
-            raise Exception(f"Current player is invalid: {self.current_player.name}\n")
+        self.history = DraftHistory(DraftState.new(self.draft_pile.draft_pile, self.starting_player.value - 1))
+        self.scheduleLookahead()
 
-        self.pick_piles.setToFirstPile()
+    def chooseStartingPlayer(self, rng=random):
+        self.starting_player = rng.choice([Players.PLAYER_ONE, Players.PLAYER_TWO])
 
     def takePile(self):
 
-        print(f"{self.current_player} takes {self.pick_piles.current_pile}.")
-
-        selected_pile = self.pick_piles.getCurrentPile().copy()
-
-        if not self.pick_piles.getCurrentPile():
-            if self.pick_piles.isLastPile():
-                print(f"End of draft.")
-                self.switchPlayer()
-                return
-            else:
-                self.pick_piles.moveToNextPile()
-                self.takePile()
+        logger.debug("%s takes pile %d.", self.current_player, self.current_pile + 1)
+        self.applyAction(Action.TAKE)
 
-        self.pick_piles.clearCurrentPile()
-        next_card = self.getNextCard()
-        if next_card:
-            self.pick_piles.getCurrentPile().append(next_card)
-
-        self.player_pulls[self.current_player] += selected_pile
-        self.switchPlayer()
+        if self.state.is_over():
+            logger.debug("End of draft.")
 
     def passPile(self):
+        self.applyAction(Action.PASS)
+
+    def applyAction(self, action):
+        previous = self.state
+        pile = previous.taken_pile() if action == Action.TAKE else previous.current_pile
+        state = self.history.play(action)
+
+        if self.game_log is not None:
+            self.game_log.append(action, pile, state)
+            if state.is_over():
+                self.game_log.archive()
+                self.game_log = None
+
+        #A taken pile starts over with its refill instead of growing
+        if action == Action.TAKE and pile is not None:
+            self.renderer.reset(('pile', pile))
+
+        self.scheduleLookahead()
+        return state
+
+    def undo(self):
+        action = self.history.undo()
+        self.renderer.reset()
+        if self.game_log is not None:
+            self.game_log.appendUndo(self.state)
+        self.scheduleLookahead()
+        return action
+
+    def restoreGame(self, log):
+        #Deals a logged game again from its seed and cube, then replays the moves
+        #after its last snapshot. Earlier moves can't be undone after a restore.
+        self.newGame(get_registry().get(log.cube_hash), seed=log.seed)
+
+        moves, state = log.readSnapshot(self.state.deck)
+        if state is not None:
+            self.history = DraftHistory(state)
+
+        for action, pile in log.actions(moves):
+            if action is None:
+                self.history.undo()
+                continue
+
+            expected = self.state.taken_pile() if action == Action.TAKE else self.state.current_pile
+            if pile != expected:
+                raise ValueError(f"Game log {log.path} does not match its replay")
+            self.history.play(action)
+
+        self.game_log = log
+        self.scheduleLookahead()
+
+    def warmCardCache(self):
+        #Resolve the whole shuffled cube in a few batched calls instead of one call per card
+        #Cards earlier games on the same cube resolved come from its bundle first, for as
+        #long as the card store would have kept them
+        self.card_warmup_names = set()
+        names = [name for name in self.draft_pile.uniqueCards() if name not in self.card_cache]
+        bundled = self.draft_pile.cube.bundled(names, self.card_store.ttl)
+        self.card_cache.update(bundled)
+
+        names = [name for name in names if name not in bundled]
+        if not names:
+            return
 
-        next_card = self.getNextCard()
-        if next_card:
-            self.pick_piles.getCurrentPile().append(next_card)
-
-        if self.pick_piles.isLastPile():
-            self.pick_piles.setToFirstPile()
-            if self.draft_pile.isEmpty():                
-                return
-            else:
-                next_card = self.getNextCard()
-            if next_card:
-                self.player_pulls[self.current_player].append(next_card)            
-
-            self.switchPlayer()
-        else:
-            self.pick_piles.moveToNextPile()
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            #No loop to run on, the store is read here and the rest resolved as they are viewed
+            self.storeCards(self.card_store.get_many_fetched(names))
+            return
+
+        #SQLite reads block, so on a loop the store is read on a thread along with the fetch
+        self.card_warmup_names = set(names)
+        self.card_warmup = asyncio.create_task(self.warmFromStore(names))
+        self.card_warmup.add_done_callback(self.warmupDone)
+
+    def warmupDone(self, warmup):
+        #Lookahead skipped the cards the warmup was resolving, whatever it didn't resolve
+        #is left to the lookahead from here on
+        if warmup is not self.card_warmup:
+            return
+        self.card_warmup_names = set()
+        if not warmup.cancelled():
+            self.scheduleLookahead()
+
+    def storeCards(self, fetched):
+        #{name: (card, fetched_at)} read from the card store
+        cards = {name: card for name, (card, _) in fetched.items()}
+        self.card_cache.update(cards)
+        self.bundleCards(cards, fetched)
+        return cards
+
+    async def warmFromStore(self, names):
+        try:
+            fetched = await asyncio.to_thread(self.card_store.get_many_fetched, names)
+        except Exception as error:
+            logger.warning("Card store read failed: %s", error)
+            fetched = {}
+        cards = self.storeCards(fetched)
+
+        names = [name for name in names if name not in cards]
+        if names:
+            cards.update(await self.fetchCollection(names))
+        return cards
+
+    async def fetchCollection(self, names):
+        try:
+            cards = await self.fetcher.fetch_collection(names)
+        except Exception:
+            cards = {}
+
+        await asyncio.to_thread(self.card_store.put_many, cards)
+        self.card_cache.update(cards)
+        self.bundleCards(cards)
+        return cards
+
+    def bundleCards(self, cards, fetched=None):
+        #Keep what this game resolved with its cube for the next game on it, stamped with
+        #when the store fetched it, or now for cards that were just fetched
+        cube = self.draft_pile.cube
+        now = time.time()
+        cube.bundle.update(
+            (name, (card_cache.slim_card(card), fetched[name][1] if fetched else now))
+            for name, card in cards.items()
+            if card and name in cube.cards.ids
+        )
 
-    def getNextCard(self):
-        next_card = self.draft_pile.getNextCard()
-        
-        #Cache card in background for quicker access later
-        self.card_thread[next_card] = self.thread_pool.submit(self.getScryfallCard, next_card)
-        
-        return next_card
+    def prefetchCards(self, card_ids, priority=0):
+        for card_name in self.cardNames(card_ids):
+            if card_name not in self.card_cache and card_name not in self.card_warmup_names:
+                self.prefetcher.prefetch(card_name, priority)
+
+    def scheduleLookahead(self):
+        #The shuffled draw order is fixed, so resolve the piles on show and the next cards
+        #to be drawn in the background before anyone asks for them
+        state = self.state
+        self.prefetchCards(state.current_pile_cards())
+        for pile in state.piles:
+            self.prefetchCards(pile)
+
+        #Priority is the card's place in the draw order, so nearer draws go first and
+        #stay ahead of cards queued on earlier moves
+        start = max(0, state.remaining - self.lookahead)
+        for position in range(state.remaining - 1, start - 1, -1):
+            self.prefetchCards((state.deck[position],), priority=len(state.deck) - position)
 
     async def displayPickPiles(self, incl_all_piles=False):
 
         results = "\n"
-        if incl_all_piles or self.pick_piles.current_pile == PickPiles.Piles.PILE_ONE:
-            results += f"\n# Pile 1: {await self.getPileInfo(self.pick_piles.pile_one)}"
+        for pile in range(PILE_COUNT):
+            if incl_all_piles or self.current_pile == pile:
+                results += f"\n# Pile {pile + 1}: {await self.renderer.render(('pile', pile), self.piles[pile])}"
 
-        if incl_all_piles or self.pick_piles.current_pile == PickPiles.Piles.PILE_TWO:
-            results += f"\n# Pile 2: {await self.getPileInfo(self.pick_piles.pile_two)}"
+        return results
 
-        if incl_all_piles or self.pick_piles.current_pile == PickPiles.Piles.PILE_THREE:
-            results += f"\n# Pile 3: {await self.getPileInfo(self.pick_piles.pile_three)}"
+    def preparePileView(self):
+        #Render what View Pile shows for the position while the player is still deciding,
+        #kept with the state it was rendered for so any later move makes it stale
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return None
 
-        return results
+        state = self.state
+        if self.pile_view is None or self.pile_view[0] is not state:
+            self.pile_view = (state, asyncio.ensure_future(self.displayPickPiles()))
+        return self.pile_view[1]
+
+    async def pileView(self):
+        return await self.preparePileView()
 
     async def displayPlayerPulls(self, player_number=None, incl_both_players=False, unformatted_list=False):
         results = "\n# Current Pulls:"
@@ -256,31 +395,56 @@ class WinstonDraft:
             player_number = Players.PLAYER_TWO
 
         if incl_both_players and not unformatted_list:
-            results += f"\n## PLAYER_ONE (x{player_one_card_count}): \n\t{self.player_pulls[Players.PLAYER_ONE]}\n"
-            results += f"\n## PLAYER_TWO (x{player_two_card_count}): \n\t{self.player_pulls[Players.PLAYER_TWO]}\n"
+            results += f"\n## PLAYER_ONE (x{player_one_card_count}): \n\t{self.cardNames(self.player_pulls[Players.PLAYER_ONE])}\n"
+            results += f"\n## PLAYER_TWO (x{player_two_card_count}): \n\t{self.cardNames(self.player_pulls[Players.PLAYER_TWO])}\n"
         elif not unformatted_list:
-            results += await self.getPileInfo(self.player_pulls[player_number])
+            results += await self.renderer.render(('pulls', player_number.value - 1), self.player_pulls[player_number])
         elif incl_both_players:
             # Unimplmenented
             pass
         else:
             results = ''
             counts = {}
-            for card in self.player_pulls[player_number]:
+            for card in self.cardNames(self.player_pulls[player_number]):
                 counts[card] = counts.get(card, 0) + 1
 
             results = '\n'.join(f'{count} {card_name}' for card_name, count in counts.items())
 
         return results
 
+    async def displayPullsPage(self, player_number, page=0, compact=False):
+        # Renders one page of a player's pulls, returns (text, page, page count).
+        # Only the cards on the page are rendered, the page is clamped to the list.
+        pulls = self.state.pulls[player_number - 1]
+        if compact:
+            counts = {}
+            for card in self.cardNames(pulls):
+                counts[card] = counts.get(card, 0) + 1
+            lines = [f"\n{count} {card_name}" for card_name, count in counts.items()]
+            page_size = COMPACT_PULLS_PAGE_SIZE
+        else:
+            lines = pulls
+            page_size = PULLS_PAGE_SIZE
+
+        page_count = max(1, -(-len(lines) // page_size))
+        page = min(max(page, 0), page_count - 1)
+        lines = lines[page * page_size:(page + 1) * page_size]
+        if not compact:
+            lines = await self.renderer.cardLines(self.cardNames(lines))
+
+        results = f"# Current Pulls (x{len(pulls)}), page {page + 1}/{page_count}:"
+        results += "".join(lines)
+        return results, page, page_count
+
     def displayDraftPile(self, sample_size=5):
         results = ""
-        results += f"Cube size: {len(self.draft_pile.draft_pile)}\n"
+        remaining_cards = self.state.deck[:self.state.remaining]
+        results += f"Cube size: {len(remaining_cards)}\n"
 
         if sample_size > 0:
-            results += f"Top {sample_size} cards of draft pile: \n\t{self.draft_pile.sample(sample_size)}\n"
+            results += f"Top {sample_size} cards of draft pile: \n\t{self.cardNames(remaining_cards[:sample_size])}\n"
         else:
-            results += f"{self.draft_pile.draft_pile}\n"
+            results += f"{self.cardNames(remaining_cards)}\n"
 
         return results
 
@@ -304,53 +468,91 @@ class WinstonDraft:
 
         print(results)
 
-    async def getCardInfo(self, card_name):        
-        if card_name not in self.card_cache:
-
-            if card_name in self.card_thread:
-                self.card_cache[card_name] = self.card_thread[card_name].result()
-            else:
-                self.card_cache[card_name] = self.getScryfallCard(card_name)
-            
-        card_info = self.card_cache[card_name] if self.card_cache[card_name] else None
-
-        if card_info:
-            return f"[{card_name}]({card_info['scryfall_uri']})"
-        
-        return f"[{card_name}]<URL Not Found>"
+    def cardNames(self, card_ids):
+        return self.draft_pile.cards.namesOf(card_ids)
 
-    def getScryfallCard(self, card_name):
+    async def getScryfallCard(self, card_name):
         if not card_name:
             return None
+
+        card = self.card_cache.get(card_name, card_cache.MISSING)
+        if card is not card_cache.MISSING:
+            return card
+
+        if card_name in self.card_warmup_names and not self.card_warmup.done():
+            self.card_cache.record_dedup()
+            await asyncio.shield(self.card_warmup)
+            card = self.card_cache.peek(card_name, card_cache.MISSING)
+            if card is not card_cache.MISSING:
+                return card
+
+        if self.prefetcher.is_pending(card_name):
+            self.card_cache.record_dedup()
+
+        return await self.prefetcher.get(card_name)
+
+    async def resolveCard(self, card_name):
+        fetched = await asyncio.to_thread(self.card_store.get_many_fetched, [card_name])
+        if fetched:
+            card = fetched[card_name][0]
+            self.card_cache[card_name] = card
+            self.bundleCards({card_name: card}, fetched)
+            return card
         
         try:
             #Not a fan of scrython's structure since it obfuscates the async API call inside the object init method
-            card = card_fetcher.quick_fetch(card_name, fuzzy=False)
+            card = await self.fetcher.fetch_card(card_name, fuzzy=False)
+            await asyncio.to_thread(self.card_store.put, card_name, card)
         except:
             card =  None
-        finally:
-            return card
 
+        self.card_cache[card_name] = card
+        self.bundleCards({card_name: card})
+        return card
 
-    async def getPileInfo(self, card_pile):
-        results = ""
-        for card in card_pile:
-            if card is not None:
-                results += "\n- " + await self.getCardInfo(card)
-        return results
+    async def validateCardList(self, card_list):
+        #Resolve every name of a submitted cube list in bulk, returns (valid, {failed name: suggestions})
+        #Raises CubeListError for malformed lines and CardLookupError when Scryfall couldn't be asked
+        names = list(dict.fromkeys(DraftPile.parseCube(card_list.splitlines())))
+
+        cards = {name: self.card_cache.peek(name) for name in names if self.card_cache.peek(name)}
+        cards.update(await asyncio.to_thread(self.card_store.get_many, [name for name in names if name not in cards]))
+
+        missing = [name for name in names if name not in cards]
+        if missing:
+            fetched = await self.fetcher.fetch_collection(missing, fuzzy_fallback=False)
+            unresolved = [name for name in missing if name not in fetched]
+            if unresolved:
+                raise card_fetcher.CardLookupError(f"{len(unresolved)} cards could not be looked up")
+            fetched = {name: card for name, card in fetched.items() if card}
+            await asyncio.to_thread(self.card_store.put_many, fetched)
+            cards.update(fetched)
+
+        #Warm the cache for the game about to start
+        self.card_cache.update(cards)
+
+        failed_cards = [name for name in names if name not in cards]
+        suggestions = await asyncio.gather(*[self.fetcher.suggest_names(name) for name in failed_cards])
+
+        return not failed_cards, dict(zip(failed_cards, suggestions))
+
+    async def close(self):
+        if self.card_warmup and not self.card_warmup.done():
+            self.card_warmup.cancel()
+        if self.pile_view is not None and not self.pile_view[1].done():
+            self.pile_view[1].cancel()
+        if self.game_log is not None:
+            self.game_log.close()
+        await self.prefetcher.close()
 
 
 async def main():
 
     draft = WinstonDraft()
-    draft.new_game("draft_files/cube.txt")
+    draft.newGame("draft_files/cube.txt")
 
     # Play Random Game
-    while (
-        any(draft.pick_piles.pile_one)
-        or any(draft.pick_piles.pile_two)
-        or any(draft.pick_piles.pile_three)
-    ):
+    while draft.inProgress():
 
         player_action = random.choice([draft.passPile, draft.takePile])
         player_action()
@@ -364,6 +566,10 @@ async def main():
 
     print(await draft.displayPlayerPulls(incl_both_players=True, unformatted_list=True))
 
+    await draft.close()
+    await card_fetcher.close_fetcher()
+    card_cache.close_card_store()
+
 
 if __name__ == "__main__":
     asyncio.run(main())
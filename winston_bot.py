@@ -1,32 +1,73 @@
+import asyncio
 import discord
 import discord.ext
+import functools
 import io
+import logging
 import random
-from datetime import datetime
-from discord.ext import commands
+import time
+from datetime import datetime, timedelta, timezone
+from discord.ext import commands, tasks
 from dotenv import load_dotenv
 from os import getenv
 from typing import Any
-from winston import WinstonDraft
-from winston import Players
+import card_cache
+import card_fetcher
+import card_index
+import metrics
+import status_updates
+from cube_registry import MAX_QUANTITY, CubeListError
+from draft_session import DEFAULT_IDLE_TIMEOUT, QueueClosed, SessionManager
+from draft_state import Action
+from winston import DEFAULT_LOOKAHEAD, Players
 
 load_dotenv()
 token = getenv("TOKEN")
 dev_guild_id = getenv("GUILD_ID")
+metrics_port = int(getenv("METRICS_PORT", metrics.DEFAULT_METRICS_PORT))
+
+# Discord bulk deletes at most 100 messages per call, none older than two weeks. Bulk
+# deletes need the Manage Messages permission even for the bot's own messages, without
+# it cleanup deletes them one at a time.
+BULK_DELETE_LIMIT = 100
+BULK_DELETE_MAX_AGE = timedelta(days=14)
+CLEANUP_CONCURRENCY = 4
+CLEANUP_REPORT_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
 
 intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix="/", intents=intents)
 
 # region Bot Variables
-bot.draft = WinstonDraft()
-bot.status_messages = {}
-bot.player_one_member = None
-bot.player_two_member = None
-bot.current_player_member = None
-bot.draft_file = getenv("CUBE_FILE_PATH")
+bot.fetcher = card_fetcher.get_fetcher()
+if getenv("CARD_INDEX_PATH"):
+    bot.fetcher.index = card_index.CardIndex(getenv("CARD_INDEX_PATH"))
+    bot.fetcher.offline = getenv("CARD_INDEX_OFFLINE", "").lower() in ("1", "true", "yes")
+bot.card_store = card_cache.PersistentCardCache(getenv("CARD_CACHE_PATH", card_cache.DEFAULT_CACHE_PATH))
+bot.sessions = SessionManager(
+    fetcher=bot.fetcher,
+    card_store=bot.card_store,
+    cache_capacity=int(getenv("CARD_CACHE_CAPACITY", card_cache.DEFAULT_CAPACITY)),
+    idle_timeout=float(getenv("SESSION_IDLE_TIMEOUT", DEFAULT_IDLE_TIMEOUT)),
+    default_draft_file=getenv("CUBE_FILE_PATH"),
+    lookahead=int(getenv("CARD_LOOKAHEAD", DEFAULT_LOOKAHEAD)),
+    status_debounce=float(getenv("STATUS_DEBOUNCE", status_updates.DEFAULT_DEBOUNCE)),
+)
+bot.sessions_restored = False
+bot.metrics_server = None
+bot.loop_monitor = None
+bot.cleanups = set()
+
+metrics.gauge("bot_active_sessions", "Live draft sessions", function=lambda: len(bot.sessions))
+metrics.gauge("card_cache_entries", "Cards in the shared memory cache", function=lambda: len(bot.sessions.card_cache))
+metrics.counter("card_cache_hits_total", "Shared memory cache hits", function=lambda: bot.sessions.card_cache.hits)
+metrics.counter("card_cache_misses_total", "Shared memory cache misses", function=lambda: bot.sessions.card_cache.misses)
+metrics.gauge("card_cache_hit_ratio", "Shared memory cache hit ratio", function=lambda: bot.sessions.card_cache.stats()['hit_ratio'])
+interactions_received = metrics.counter("bot_interactions_received_total", "Interactions received by type", ("type",))
+stale_moves = metrics.counter("bot_stale_moves_total", "Moves dropped because the game moved on after the click", ("action",))
 bot.new_thread_name = "A Grand Campaign"
-bot.new_thread = None
 bot.game_quotes = {
     "MissingPlayerOne": 
 				["Hold your horses! A battle needs two sides, unless of course one intends to outwit themselves."
@@ -44,6 +85,15 @@ bot.game_quotes = {
     "CardListInvalid": 
 				["A perplexing mystery! These cards have vanished like Rommel's troops in the desert."
 				],
+    "CardListMalformed":
+				[f"These orders are garbled, old boy. Each line wants a card name, with at most {MAX_QUANTITY} copies in front of it."
+				],
+    "GameStartError":
+				["The campaign could not get under way, the orders went astray. Press a seat button to try again."
+				],
+    "CardListError":
+				["The quartermaster could not inspect these cards just now. Do try again shortly."
+				],
     "CardListLoaded": 
 				["Splendid! Our unconventional weaponry is in place. Let us surprise the enemy!"
 				],
@@ -79,6 +129,9 @@ bot.game_quotes = {
                 "A classic choice, but one that I shall meet with equal resolve.",
                 "I must admit, you've piqued my curiosity. I shall tread carefully."
 				],
+    "NotYourTurn":
+                ["Patience, my friend! Your opponent has the floor."
+                ],
     "GameInProgress":
                 ["My dear fellow, a new challenger must wait their turn! We are in the midst of a grand battle here, a clash of intellect and strategy!"                
                 ],
@@ -91,10 +144,32 @@ bot.game_quotes = {
 @bot.event
 async def on_ready():
     
-    print(f"User: {bot.user} (ID: {bot.user.id})")
+    logger.info("User: %s (ID: %s)", bot.user, bot.user.id)
     bot.tree.copy_global_to(guild=discord.Object(id=dev_guild_id))
     await bot.tree.sync(guild=discord.Object(id=dev_guild_id))
-    print(f"Synced and ready.")
+    if not evict_idle_sessions.is_running():
+        evict_idle_sessions.start()
+    if bot.loop_monitor is None:
+        bot.loop_monitor = asyncio.create_task(metrics.monitor_loop_lag())
+    if bot.metrics_server is None and metrics_port:
+        bot.metrics_server = await metrics.start_server(port=metrics_port)
+    if not bot.sessions_restored:
+        bot.sessions_restored = True
+        await restore_sessions()
+    logger.info("Synced and ready.")
+
+
+@bot.event
+async def on_interaction(interaction: discord.Interaction):
+    interactions_received.inc(type=interaction.type.name)
+
+
+@tasks.loop(minutes=5)
+async def evict_idle_sessions():
+    for session in await bot.sessions.evictIdle():
+        logger.info("Closed idle session %s", session.session_id)
+    # Expired cards are never read again, drop them so the store doesn't grow forever
+    await asyncio.to_thread(bot.card_store.purge_stale)
 
 
 # endregion
@@ -103,33 +178,57 @@ async def on_ready():
 @bot.tree.command(name="close")
 async def shutdown(interaction: discord.Interaction):
 
-    await clean_up(interaction.channel)
-    await interaction.response.send_message(content='Stopped', ephemeral=True)
+    await interaction.response.send_message(content='Stopping', ephemeral=True)
+    # Games still being played are logged and pick up again on the next start, so they
+    # keep their log and their thread
+    await (await clean_up(interaction.channel, report=cleanup_reporter(interaction), keep_live=True))
+    await interaction.edit_original_response(content='Stopped')
+    await bot.sessions.closeAll(archive=False)
+    await card_fetcher.close_fetcher()
+    if bot.metrics_server is not None:
+        await bot.metrics_server.cleanup()
     await bot.close()
 
 @bot.tree.command(name="cache")
 async def view_cache(interaction: discord.Interaction):
-    cache = bot.draft.card_cache  
-    if interaction.user.id not in bot.status_messages:
-        print(f'Adding message to sent messages')
-        await interaction.response.send_message(content=cache, ephemeral=True)
-        bot.status_messages[interaction.user.id] = interaction.original_response()
+    stats = bot.sessions.card_cache.stats()
+    limiter = bot.fetcher.rate_limiter.stats()
+    message = (
+        f"Active sessions: {len(bot.sessions)}\n"
+        f"Cards cached: {stats['size']}/{stats['capacity']}\n"
+        f"Hits: {stats['hits']} | Misses: {stats['misses']} | Hit ratio: {stats['hit_ratio']:.0%}\n"
+        f"Evictions: {stats['evictions']} | In-flight dedups: {stats['dedups']}\n"
+        f"Coalesced Scryfall requests: {bot.fetcher.coalesced}\n"
+        f"Rate limit waits: {limiter['delayed']}/{limiter['acquired']} requests, "
+        f"avg {limiter['average_wait'] * 1000:.0f}ms, max {limiter['max_wait'] * 1000:.0f}ms | "
+        f"429s: {bot.fetcher.throttled} | Retries: {bot.fetcher.retries}"
+    )
+    await interaction.response.send_message(content=message, ephemeral=True)
+
+@bot.tree.command(name="metrics")
+@discord.app_commands.default_permissions(administrator=True)
+async def view_metrics(interaction: discord.Interaction):
+    message = metrics.summary()
+    if len(message) > 1900:
+        await interaction.response.send_message(
+            file=discord.File(io.StringIO(metrics.REGISTRY.render()), "metrics.txt"), ephemeral=True
+        )
     else:
-        print(f'Fetching and editting sent message for user id {interaction.user.id}')
-        bot.status_messages[interaction.user.id].edit_message(content=cache)
+        await interaction.response.send_message(content=f"```\n{message}\n```", ephemeral=True)
 
 @bot.tree.command(name="restart")
 async def restart(interaction: discord.Interaction):
-    await clean_up(interaction.channel)
+    await interaction.response.send_message(content='Restarting', ephemeral=True)
+    # Old messages are deleted in the background while the new game is set up
+    await clean_up(interaction.channel, report=cleanup_reporter(interaction))
     await new_thread(interaction=interaction)
 
 @bot.tree.command(name="deploy")
 async def deploy(interaction: discord.Interaction):
 
     await new_thread(interaction=interaction)
-    await interaction.response.send_message(content="Deploy", delete_after=0.5, ephemeral=True)
-    bot.player_one_member = None
-    bot.player_two_member = None
+    if not interaction.response.is_done():
+        await interaction.response.send_message(content="Deploy", delete_after=0.5, ephemeral=True)
 
 # endregion
 
@@ -138,44 +237,270 @@ def get_quote(decode):
     return random.choice(bot.game_quotes[decode])
 
 async def new_thread(interaction):
-    if bot.new_thread:
-        await interaction.response.send_message(content=get_quote("GameInProgress"), delete_after=2)
+    # Each thread hosts its own game, only a thread that already has one is turned away
+    if bot.sessions.get(interaction.channel.id):
+        await send_response(interaction, get_quote("GameInProgress"), ephemeral=True)
         return
-    bot.new_thread = await interaction.channel.create_thread(name=bot.new_thread_name, type=discord.ChannelType.public_thread)
-
-    await bot.new_thread.send(
-        get_quote("Deploy"),
-        view=StartButtons(ctx=bot.new_thread, timeout=None),
-    )
+    thread = await interaction.channel.create_thread(name=bot.new_thread_name, type=discord.ChannelType.public_thread)
 
-async def new_game(ctx):
+    session = bot.sessions.create(thread.id, interaction.channel.id)
+    session.thread = thread
+    await track_thread_notice(interaction.channel, thread, session)
 
-    if not bot.player_one_member:
-        await ctx.send(get_quote("MissingPlayerOne"))
+    session.track(await thread.send(
+        get_quote("Deploy"),
+        view=StartButtons(ctx=thread, session=session, timeout=None),
+    ))
+
+async def track_thread_notice(channel, thread, session):
+    # Creating the thread leaves a "started a thread" notice in the channel, it is
+    # posted right after the thread so it is among the first messages that follow it
+    try:
+        async for message in channel.history(limit=5, after=thread, oldest_first=True):
+            if message.type == discord.MessageType.thread_created and message.reference and message.reference.channel_id == thread.id:
+                session.track(message)
+                return
+    except discord.HTTPException as error:
+        logger.debug("Could not find the notice for thread %s: %s", thread.id, error)
+
+async def restore_sessions():
+    # Buttons don't survive a restart, so every restored game gets a fresh status message
+    for session, player_ids in await bot.sessions.restore():
+        try:
+            thread = bot.get_channel(session.session_id) or await bot.fetch_channel(session.session_id)
+            session.thread = thread
+            session.player_one_member = await thread.guild.fetch_member(player_ids[0])
+            session.player_two_member = await thread.guild.fetch_member(player_ids[1])
+        except discord.DiscordException as error:
+            logger.warning("Dropping restored session %s: %s", session.session_id, error)
+            await bot.sessions.close(session.session_id)
+            continue
+
+        await update_player(ctx=thread, session=session)
+        session.last_action_message = get_quote("Start")
+        await send_status(thread, session)
+        logger.info("Restored session %s", session.session_id)
+
+async def new_game(ctx, session):
+
+    if not session.player_one_member:
+        session.track(await ctx.send(get_quote("MissingPlayerOne")))
         return
 
-    if not bot.player_two_member:
-        await ctx.send(get_quote("MissingPlayerTwo"))
+    if not session.player_two_member:
+        session.track(await ctx.send(get_quote("MissingPlayerTwo")))
         return
 
-    bot.draft.new_game(bot.draft_file)
+    async with session.lock:
+        if session.game_started:
+            return
 
-    await update_player(ctx=ctx)
-    bot.last_action_message = (
-        get_quote("Start")
-    )
-    await ctx.send(embed=DraftStatusEmbed(), view=ActionButtons(ctx=ctx, timeout=None))
+        try:
+            session.startGame()
+        except Exception:
+            # Left unstarted, so filling the seats again retries
+            logger.exception("Starting the game of session %s failed", session.session_id)
+            session.track(await ctx.send(get_quote("GameStartError")))
+            return
+        session.game_started = True
 
-async def clean_up(channel: discord.abc.GuildChannel):
-    async for msg in channel.history():
-        if msg.author.id == bot.user.id:
-            await msg.delete()
+        await update_player(ctx=ctx, session=session)
+        session.last_action_message = (
+            get_quote("Start")
+        )
+    await send_status(ctx, session)
+
+async def send_status(ctx, session):
+    embed = DraftStatusEmbed(session)
+    view = ActionButtons(ctx=ctx, session=session, timeout=None)
+    session.status_message = session.track(await ctx.send(embed=embed, view=view))
+    session.updates.mark_shown('status', (view.version, embed.to_dict()))
+    session.draft.preparePileView()
+
+def schedule_updates(session):
+    # After a move: the status embed, and the pile view of the player to move if they
+    # have one open. Both are edited at most once per debounce window and only when
+    # they changed, the pile view is rendered ahead while the player decides.
+    session.draft.preparePileView()
+    if session.status_message is not None:
+        session.updates.schedule(
+            'status', functools.partial(status_payload, session), functools.partial(edit_status, session)
+        )
+
+    member = session.current_player_member
+    if member is not None and member.id in session.status_messages:
+        session.updates.schedule(
+            ('pile', member.id), session.draft.pileView, functools.partial(edit_pile_view, session, member.id)
+        )
 
-    for thread in channel.threads:
-        if thread.owner_id == bot.user.id:
-            await thread.delete()
+async def status_payload(session):
+    return session.version, DraftStatusEmbed(session).to_dict()
+
+async def edit_status(session, payload):
+    # The buttons are replaced along with the embed, so a click is checked against the
+    # position its message showed rather than the one the game reached since
+    version, embed = payload
+    view = ActionButtons(ctx=session.status_message.channel, session=session, version=version, timeout=None)
+    await session.status_message.edit(embed=discord.Embed.from_dict(embed), view=view)
+
+async def edit_pile_view(session, user_id, content):
+    try:
+        await session.status_messages[user_id].edit(content=content)
+    except discord.HTTPException:
+        # Interaction tokens run out after 15 minutes, View Pile sends a new message then
+        session.status_messages.pop(user_id, None)
+        raise
+
+async def clean_up(channel: discord.abc.GuildChannel, report=None, keep_live=False):
+    # Closes the channel's sessions, then deletes what they posted in a background task
+    # which is returned. Only the messages and threads the sessions tracked are touched,
+    # the channel's history is never read. With keep_live, sessions with a logged game
+    # still being played are left alone.
+    deletions = []
+    for session in bot.sessions.forChannel(channel.id):
+        if keep_live and session.draft.game_log is not None:
+            continue
+        await bot.sessions.close(session.session_id)
+
+        # A game thread goes in one call along with everything in it, unless the
+        # cleanup was started from inside it
+        owned = dict(session.owned_messages)
+        if session.session_id != channel.id:
+            owned.pop(session.session_id, None)
+            deletions.append(functools.partial(delete_thread, session))
+
+        for channel_id, message_ids in owned.items():
+            deletions.extend(
+                functools.partial(delete_messages, channel if channel_id == channel.id else channel_id, batch)
+                for batch in message_batches(message_ids)
+            )
+
+    task = asyncio.create_task(run_deletions(deletions, report))
+    bot.cleanups.add(task)
+    task.add_done_callback(bot.cleanups.discard)
+    return task
+
+def message_batches(message_ids):
+    # Recent messages in bulk delete sized batches, older ones one at a time
+    cutoff = datetime.now(timezone.utc) - BULK_DELETE_MAX_AGE
+    recent = sorted(message_id for message_id in message_ids if discord.utils.snowflake_time(message_id) > cutoff)
+    for start in range(0, len(recent), BULK_DELETE_LIMIT):
+        yield recent[start:start + BULK_DELETE_LIMIT]
+    for message_id in message_ids:
+        if discord.utils.snowflake_time(message_id) <= cutoff:
+            yield [message_id]
+
+async def resolve_channel(channel_id):
+    return bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+
+async def delete_thread(session):
+    thread = session.thread if session.thread else await resolve_channel(session.session_id)
+    await thread.delete()
+
+async def delete_messages(channel, message_ids):
+    if isinstance(channel, int):
+        channel = await resolve_channel(channel)
+    if len(message_ids) > 1:
+        try:
+            await channel.delete_messages([discord.Object(id=message_id) for message_id in message_ids])
+            return
+        except discord.Forbidden:
+            logger.info("No Manage Messages permission in %s, deleting one message at a time", channel.id)
+
+    for message_id in message_ids:
+        try:
+            await channel.get_partial_message(message_id).delete()
+        except discord.NotFound:
+            pass
+
+async def run_deletions(deletions, report=None):
+    # At most CLEANUP_CONCURRENCY deletes in flight, `report(done, total)` after each
+    semaphore = asyncio.Semaphore(CLEANUP_CONCURRENCY)
+    done = 0
+
+    async def run(deletion):
+        nonlocal done
+        async with semaphore:
+            try:
+                await deletion()
+            except discord.NotFound:
+                pass
+            except discord.HTTPException as error:
+                logger.warning("Cleanup delete failed: %s", error)
+        done += 1
+        if report is not None:
+            await report(done, len(deletions))
+
+    await asyncio.gather(*map(run, deletions))
+    logger.info("Cleanup finished, %d deletes", len(deletions))
+
+def cleanup_reporter(interaction: discord.Interaction):
+    # Shows cleanup progress on the command's own response, edited at most once per interval
+    last_report = 0.0
+
+    async def report(done, total):
+        nonlocal last_report
+        now = time.monotonic()
+        if done < total and now - last_report < CLEANUP_REPORT_INTERVAL:
+            return
+        last_report = now
+        try:
+            await interaction.edit_original_response(content=f"Cleaning up: {done}/{total}")
+        except discord.HTTPException:
+            pass
+
+    return report
+
+async def check_session(session, interaction: discord.Interaction):
+    # Buttons outlive idle sessions, only let them act on a session that is still registered
+    if bot.sessions.get(session.session_id) is not session:
+        await interaction.response.send_message("No draft in progress.", ephemeral=True)
+        return False
+
+    return True
+
+def deferred(function):
+    # Acknowledges a component interaction before doing any work, then runs the handler
+    # on its session's task queue so interactions on one game apply in order. Handlers
+    # answer with follow-ups or by editing the message the component is on. Goes above
+    # metrics.instrumented, so the handler is timed from when the queue starts it and
+    # the wait is recorded apart.
+    @functools.wraps(function)
+    async def wrapper(view, interaction: discord.Interaction, *args):
+        if not interaction.response.is_done():
+            await interaction.response.defer()
+        metrics.record_ack(function.__name__, (discord.utils.utcnow() - interaction.created_at).total_seconds())
+
+        queued_at = time.perf_counter()
+
+        async def job():
+            metrics.interaction_queue_seconds.observe(time.perf_counter() - queued_at, handler=function.__name__)
+            return await function(view, interaction, *args)
+
+        try:
+            await view.session.tasks.submit(job)
+        except QueueClosed:
+            # The session closed while the interaction was being acknowledged
+            await interaction.followup.send("No draft in progress.", ephemeral=True)
+
+    return wrapper
+
+async def send_response(interaction: discord.Interaction, content, **kwargs):
+    if interaction.response.is_done():
+        await interaction.followup.send(content, **kwargs)
+    else:
+        await interaction.response.send_message(content, **kwargs)
 
-    bot.new_thread = None
+def format_failed_cards(failed_cards, max_length=1500):
+    lines = []
+    for name, suggestions in failed_cards.items():
+        line = f"- {name}" + (f" (did you mean {', '.join(suggestions)}?)" if suggestions else "")
+        if sum(len(existing) + 1 for existing in lines) + len(line) > max_length:
+            lines.append(f"...and {len(failed_cards) - len(lines)} more")
+            break
+        lines.append(line)
+
+    return "\n".join(lines)
 
 async def send_dm(member: discord.Member, *, message):
     channel = await member.create_dm()
@@ -187,71 +512,60 @@ async def respond_with_dm(ctx, message):
     await send_dm(member=member, message=message)
 
 
-async def send_pulls_file(interaction, file_name):
+async def send_pulls_file(interaction, session, file_name):
 
     # write to file
 
-    if interaction.user.id == bot.player_one_member.id:
-        content = await bot.draft.displayPlayerPulls(1, unformatted_list=True)
-    elif interaction.user.id == bot.player_two_member.id:
-        content = await bot.draft.displayPlayerPulls(2, unformatted_list=True)
+    if interaction.user.id == session.player_one_member.id:
+        content = await session.draft.displayPlayerPulls(1, unformatted_list=True)
+    elif interaction.user.id == session.player_two_member.id:
+        content = await session.draft.displayPlayerPulls(2, unformatted_list=True)
 
     file = io.StringIO(content)
 
     # send file to Discord in message
-    await interaction.response.send_message(
+    await send_response(
+        interaction,
         get_quote("PlayerPullsFile"),
         file=discord.File(file, file_name),
         ephemeral=True,
     )
 
 
-async def update_player(ctx):
+async def update_player(ctx, session):
     member = None
 
-    if bot.draft.current_player.value == 1:
-        member = bot.player_one_member
-    elif bot.draft.current_player.value == 2:
-        member = bot.player_two_member
+    if session.draft.current_player.value == 1:
+        member = session.player_one_member
+    elif session.draft.current_player.value == 2:
+        member = session.player_two_member
     else:
-        await ctx.send(
-            f"Failed to determine player. Current player set to: {bot.draft.current_player}"
-        )
+        session.track(await ctx.send(
+            f"Failed to determine player. Current player set to: {session.draft.current_player}"
+        ))
 
     # update current player member
-    bot.current_player_member = member
+    session.current_player_member = member
 
 
-async def take_pile(ctx, interaction):
-    if not bot.draft.in_progress:
-        await interaction.response.send_message(
-            "No draft in progress.",
-            ephemeral=True,
-        )
-        return False
+async def play_move(ctx, session, interaction, action, version):
+    # `version` is the position the clicked buttons were shown with
+    async with session.lock:
+        # Checked first, a double click must not be answered as a click out of turn
+        if version != session.version:
+            stale_moves.inc(action=action.name)
+            logger.debug("Dropped a stale %s on session %s", action.name, session.session_id)
+            return False
 
-    if bot.current_player_member.id != interaction.user.id:
-        await interaction.response.send_message(get_quote("NonParticipantAction"), ephemeral=True)
-        return False
-    bot.draft.takePile()
-    await update_player(ctx=ctx)
-
-    return True
+        if not session.draft.inProgress():
+            await send_response(interaction, "No draft in progress.", ephemeral=True)
+            return False
 
-
-async def pass_pile(ctx, interaction):
-    if not bot.draft.in_progress:
-        await interaction.response.send_message(
-            "No draft in progress.",
-            ephemeral=True,
-        )
-        return False
-
-    if bot.current_player_member.id != interaction.user.id:
-        await interaction.response.send_message(get_quote("NonParticipantAction"), ephemeral=True)
-        return False
-    bot.draft.passPile()
-    await update_player(ctx=ctx)
+        if session.current_player_member.id != interaction.user.id:
+            await send_response(interaction, get_quote("NonParticipantAction"), ephemeral=True)
+            return False
+        session.play(action, version)
+        await update_player(ctx=ctx, session=session)
 
     return True
 
@@ -266,136 +580,184 @@ class FileModal(discord.ui.Modal, title='Load Custom Cube List'):
         label="Card List", style=discord.TextStyle.long, required=True
     )
 
+    def __init__(self, session, **kwargs):
+        super().__init__(**kwargs)
+        self.session = session
+
+    @metrics.instrumented("file_modal")
     async def on_submit(self, interaction: discord.Interaction) -> None:
 
-        #TODO: add validation for input with draft card db
-        valid_list, failed_cards = True, []
+        # Most lists resolve from cache well within the interaction window,
+        # defer only when validation runs long so the response doesn't time out
+        validation = asyncio.ensure_future(self.session.draft.validateCardList(self.file_contents.value))
+        try:
+            try:
+                valid_list, failed_cards = await asyncio.wait_for(asyncio.shield(validation), timeout=2)
+            except asyncio.TimeoutError:
+                await interaction.response.defer(thinking=True)
+                valid_list, failed_cards = await validation
+        except CubeListError as error:
+            lines = "\n".join(f"- Line {number}: `{line[:100]}`" for number, line in error.lines[:20])
+            await self.send_private(interaction, get_quote("CardListMalformed"), lines)
+            return
+        except Exception:
+            logger.exception("Validating a cube list failed")
+            await self.send_private(interaction, get_quote("CardListError"))
+            return
 
         if not valid_list:
-            await interaction.response.send_message(get_quote("CardListInvalid") + f"\n\n{failed_cards}", ephemeral=True)
+            await self.send_private(interaction, get_quote("CardListInvalid"), format_failed_cards(failed_cards))
         else:
-            with open("draft_files/test.txt", "w") as file:
-                file.writelines(self.file_contents.value)
+            # Registered by content hash, simultaneous uploads can't overwrite each other
+            self.session.cube = self.session.cubes.register(self.file_contents.value)
+            await send_response(interaction, get_quote("CardListLoaded"))
+
+    async def send_private(self, interaction: discord.Interaction, message, details=None):
+        # A deferred response is public and the first follow-up replaces it, so once
+        # deferred it only gets the headline and the details go in a new ephemeral message
+        content = f"{message}\n\n{details}" if details else message
+        if not interaction.response.is_done():
+            await interaction.response.send_message(content, ephemeral=True)
+            return
 
-            bot.draft_file = "draft_files/test.txt"
-            await interaction.response.send_message(get_quote("CardListLoaded"))
+        await interaction.edit_original_response(content=message)
+        if details:
+            await interaction.followup.send(content, ephemeral=True)
 
 
 # endregion
 
 # region Buttons
 class StartButtons(discord.ui.View):
-    def __init__(self, ctx, *, timeout=None):
+    def __init__(self, ctx, session, *, timeout=None):
         super().__init__(timeout=timeout)
         self.ctx = ctx
+        self.session = session
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await check_session(self.session, interaction)
 
     @discord.ui.button(label='Load Custom List', style=discord.ButtonStyle.gray)
+    @metrics.instrumented("send_file_load_modal")
     async def send_file_load_modal(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_modal(FileModal(timeout=None))
+        await interaction.response.send_modal(FileModal(self.session, timeout=None))
 
     @discord.ui.button(label="Player One", style=discord.ButtonStyle.gray)
+    @deferred
+    @metrics.instrumented("set_player_one")
     async def set_player_one(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ):
-        if not bot.player_one_member:
-            bot.player_one_member = await self.ctx.guild.fetch_member(
+        if not self.session.player_one_member:
+            self.session.player_one_member = await self.ctx.guild.fetch_member(
                 interaction.user.id
             )
             button.label = f"{interaction.user.display_name}"
             button.style = discord.ButtonStyle.green
-            await interaction.response.edit_message(
+            await interaction.edit_original_response(
                 content=get_quote("PlayerOneSet"), view=self
             )
         else:
-            await interaction.response.send_message(
+            await interaction.followup.send(
                 get_quote("PlayerOneDuplicate"), ephemeral=True
             )
 
-        if bot.player_one_member and bot.player_two_member:
-            await new_game(self.ctx)
+        if self.session.player_one_member and self.session.player_two_member:
+            await new_game(self.ctx, self.session)
 
     @discord.ui.button(label="Player Two", style=discord.ButtonStyle.gray)
+    @deferred
+    @metrics.instrumented("set_player_two")
     async def set_player_two(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ):
-        if not bot.player_two_member:
-            bot.player_two_member = await self.ctx.guild.fetch_member(
+        if not self.session.player_two_member:
+            self.session.player_two_member = await self.ctx.guild.fetch_member(
                 interaction.user.id
             )
             button.label = f"{interaction.user.display_name}"
             button.style = discord.ButtonStyle.green
-            await interaction.response.edit_message(
+            await interaction.edit_original_response(
                 content=get_quote("PlayerTwoSet"), view=self
             )
         else:
-            await interaction.response.send_message(
+            await interaction.followup.send(
                 get_quote("PlayerTwoDuplicate"), ephemeral=True
             )
 
-        if bot.player_one_member and bot.player_two_member:
-            await new_game(self.ctx)
+        if self.session.player_one_member and self.session.player_two_member:
+            await new_game(self.ctx, self.session)
 
 class ActionButtons(discord.ui.View):
-    def __init__(self, ctx, *, timeout=None):
+    # Take and Pass only apply to the game version the buttons were sent with, every
+    # status edit sends a new set
+    def __init__(self, ctx, session, *, version=None, timeout=None):
         super().__init__(timeout=timeout)
         self.ctx = ctx
+        self.session = session
+        self.version = session.version if version is None else version
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await check_session(self.session, interaction)
 
     @discord.ui.button(label="View Pulls", style=discord.ButtonStyle.gray)
+    @deferred
+    @metrics.instrumented("view_pulls")
     async def view_pulls(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ):
-        if not bot.draft.in_progress():
-            if interaction.user.id == bot.player_one_member.id:
+        if not self.session.draft.inProgress():
+            if interaction.user.id == self.session.player_one_member.id:
                 # send player one pulls file
                 await send_pulls_file(
-                    interaction=interaction, file_name="player_one_pulls.txt"
+                    interaction=interaction, session=self.session, file_name="player_one_pulls.txt"
                 )
-            if interaction.user.id == bot.player_two_member.id:
+            if interaction.user.id == self.session.player_two_member.id:
                 # send player two pulls list
                 await send_pulls_file(
-                    interaction=interaction, file_name="player_two_pulls.txt"
+                    interaction=interaction, session=self.session, file_name="player_two_pulls.txt"
                 )
                 
             return
 
-        message = ""
-        if interaction.user.id == bot.player_one_member.id:
-            message += await bot.draft.displayPlayerPulls(1)
-        if interaction.user.id == bot.player_two_member.id:
-            message += await bot.draft.displayPlayerPulls(2)
-        
-        if interaction.user.id not in [bot.player_one_member.id, bot.player_two_member.id]:
-            message = get_quote("NonParticipantAction")
-
-        if len(message) > 2000:
-            temp = ""
-            for line in message.splitlines():
-                if len(line) + len(temp) <= 2000:
-                    temp += f"{line}\n"
-                else:
-                    await interaction.response.send_message(
-                        temp, ephemeral=True, delete_after=10
-                    )
-                    temp = ""
-        else:
-            await interaction.response.send_message(
-                message, ephemeral=True, delete_after=10
-            )
+        if not self.session.isPlayer(interaction.user.id):
+            await send_response(interaction, get_quote("NonParticipantAction"), ephemeral=True)
+            return
+
+        # Someone playing both seats sees the pulls of the seat whose turn it is
+        player_number = 2 if interaction.user.id == self.session.player_two_member.id else 1
+        if interaction.user.id == self.session.current_player_member.id:
+            player_number = self.session.draft.current_player.value
+
+        pager = PullsPager(self.session, player_number)
+        await send_response(interaction, await pager.render(), view=pager, ephemeral=True)
 
     async def display_pile(self, interaction: discord.Interaction):
-        if bot.current_player_member.id == interaction.user.id:
-            message = await bot.draft.displayPickPiles()
-            if interaction.user.id not in bot.status_messages:
-                print(f'Adding message to sent messages')
-                await interaction.response.send_message(content=message, ephemeral=True)
-                bot.status_messages[interaction.user.id] = interaction
-            else:
-                print(f'Fetching and editting sent message for user id {interaction.user.id}')
-                await bot.status_messages[interaction.user.id].edit_original_response(content=message)
-                if not interaction.response.is_done():
-                    await interaction.response.edit_message() #just respond to the interaction so it goes away
+        if self.session.current_player_member.id != interaction.user.id:
+            await interaction.followup.send(get_quote("NotYourTurn"), ephemeral=True)
+            return
+
+        message = await self.session.draft.pileView()
+        key = ('pile', interaction.user.id)
+        pile_message = self.session.status_messages.get(interaction.user.id)
+        if pile_message is not None and self.session.updates.shown(key) != message:
+            logger.debug("Editing the pile message of user id %s", interaction.user.id)
+            try:
+                await pile_message.edit(content=message)
+            except discord.HTTPException:
+                # Follow-ups can't be edited once the interaction token runs out
+                pile_message = None
+
+        if pile_message is None:
+            logger.debug("Sending a pile message to user id %s", interaction.user.id)
+            self.session.status_messages[interaction.user.id] = await interaction.followup.send(
+                content=message, ephemeral=True, wait=True
+            )
+        self.session.updates.mark_shown(key, message)
 
     @discord.ui.button(label="View Pile", style=discord.ButtonStyle.gray)
+    @deferred
+    @metrics.instrumented("view_pile_button")
     async def view_pile_button(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ):
@@ -403,30 +765,78 @@ class ActionButtons(discord.ui.View):
 
 
     @discord.ui.button(label="Take", style=discord.ButtonStyle.gray)
+    @deferred
+    @metrics.instrumented("take_button")
     async def take_button(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ):
 
-        if await take_pile(self.ctx, interaction):
+        if await play_move(self.ctx, self.session, interaction, Action.TAKE, self.version):
 
-            bot.last_action_message = get_quote("TakePile")
-            await interaction.response.edit_message(embed=DraftStatusEmbed(), view=self)
-
-            await self.display_pile(interaction)
+            self.session.last_action_message = get_quote("TakePile")
+            schedule_updates(self.session)
 
 
     @discord.ui.button(label="Pass", style=discord.ButtonStyle.gray)
+    @deferred
+    @metrics.instrumented("pass_button")
     async def pass_button(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ):
 
-        if await pass_pile(self.ctx, interaction):
+        if await play_move(self.ctx, self.session, interaction, Action.PASS, self.version):
+
+            self.session.last_action_message = get_quote("PassPile")
+            schedule_updates(self.session)
 
-            bot.last_action_message = get_quote("PassPile")
-            await interaction.response.edit_message(embed=DraftStatusEmbed(), view=self)
 
-            await self.display_pile(interaction)
+class PullsPager(discord.ui.View):
+    # One page of a player's pulls at a time, rendered when it is shown.
+    # Paging edits the pager's own message instead of sending new ones.
 
+    def __init__(self, session, player_number, *, timeout=300):
+        super().__init__(timeout=timeout)
+        self.session = session
+        self.player_number = player_number
+        self.page = 0
+        self.compact = False
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await check_session(self.session, interaction)
+
+    async def render(self):
+        content, self.page, page_count = await self.session.draft.displayPullsPage(
+            self.player_number, page=self.page, compact=self.compact
+        )
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= page_count - 1
+        self.toggle_compact.label = "Links" if self.compact else "Compact"
+        return content[:2000]
+
+    async def show(self, interaction: discord.Interaction):
+        await interaction.edit_original_response(content=await self.render(), view=self)
+
+    @discord.ui.button(label="Prev", style=discord.ButtonStyle.gray)
+    @deferred
+    @metrics.instrumented("previous_page")
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page -= 1
+        await self.show(interaction)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.gray)
+    @deferred
+    @metrics.instrumented("next_page")
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await self.show(interaction)
+
+    @discord.ui.button(label="Compact", style=discord.ButtonStyle.gray)
+    @deferred
+    @metrics.instrumented("toggle_compact")
+    async def toggle_compact(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.compact = not self.compact
+        self.page = 0
+        await self.show(interaction)
 
 # endregion Buttons
 
@@ -435,6 +845,7 @@ class ActionButtons(discord.ui.View):
 class DraftStatusEmbed(discord.Embed):
     def __init__(
         self,
+        session,
         *,
         colour: int | discord.Colour | None = None,
         color: int | discord.Colour | None = None,
@@ -449,38 +860,38 @@ class DraftStatusEmbed(discord.Embed):
             title=("-"*25) + get_quote("GameStateTitle") + ("-"*25),
             type="rich",
             url=url,
-            description=f"{bot.last_action_message}",
+            description=f"{session.last_action_message}",
             timestamp=timestamp,
         )
 
-        current_pile = bot.draft.pick_piles.current_pile
+        current_pile = session.draft.current_pile
 
-        draft_pile_count = bot.draft.draft_pile.cardsRemaining()
-        pile_one_count = len(bot.draft.pick_piles.pile_one)
-        pile_two_count = len(bot.draft.pick_piles.pile_two)
-        pile_three_count = len(bot.draft.pick_piles.pile_three)
+        draft_pile_count = session.draft.cardsRemaining()
+        pile_one_count = len(session.draft.piles[0])
+        pile_two_count = len(session.draft.piles[1])
+        pile_three_count = len(session.draft.piles[2])
 
-        player_one_card_count = len(bot.draft.player_pulls[Players.PLAYER_ONE])
-        player_two_card_count = len(bot.draft.player_pulls[Players.PLAYER_TWO])
+        player_one_card_count = len(session.draft.player_pulls[Players.PLAYER_ONE])
+        player_two_card_count = len(session.draft.player_pulls[Players.PLAYER_TWO])
 
         self.add_field(
             name="Current player: ",
-            value=f"{bot.current_player_member.mention}",
+            value=f"{session.current_player_member.mention}",
             inline=False,
         )
         self.add_field(name=":books:", value=draft_pile_count, inline=False)
         self.add_field(
-            name=":open_book:" if current_pile.value == 1 else ":blue_book:",
+            name=":open_book:" if current_pile == 0 else ":blue_book:",
             value=pile_one_count,
             inline=True,
         )
         self.add_field(
-            name=":open_book:" if current_pile.value == 2 else ":blue_book:",
+            name=":open_book:" if current_pile == 1 else ":blue_book:",
             value=pile_two_count,
             inline=True,
         )
         self.add_field(
-            name=":open_book:" if current_pile.value == 3 else ":blue_book:",
+            name=":open_book:" if current_pile == 2 else ":blue_book:",
             value=pile_three_count,
             inline=True,
         )
@@ -493,4 +904,9 @@ class DraftStatusEmbed(discord.Embed):
 
 #endregion
 
-bot.run(token=token)
+if __name__ == "__main__":
+    # Logging goes through a queue so handlers never write on the event loop
+    metrics.setup_logging()
+    bot.run(token=token, log_handler=None)
+    bot.card_store.close()
+    metrics.stop_logging()
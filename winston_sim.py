@@ -0,0 +1,213 @@
+import argparse
+import concurrent.futures
+import os
+import time
+
+import numpy as np
+
+from cube_registry import CardTable, parseCube
+
+# Where each card of a game's deck currently is, per deck position
+IN_DRAFT_PILE = 0
+IN_PILE = (1, 2, 3)
+TAKEN = (4, 5)
+BLIND_PICK = (6, 7)
+
+MAX_PILE_SIZE = 32
+
+
+def loadCubeIds(file_path):
+    # Interns the cube's card names, returns (names, ids) with one id per card copy
+    with open(file_path) as infile:
+        cube = parseCube(infile)
+    cards = CardTable()
+    return cards.names, np.frombuffer(cards.internAll(cube), dtype=np.uint16).astype(np.int32)
+
+
+def simulateBatch(cube_ids, games, card_limit=90, take_probability=0.5, seed=None, max_moves=None):
+    # Plays `games` random Winston drafts side by side with the same rules as
+    # DraftState.apply, one vectorized step per move across the batch
+    rng = np.random.default_rng(seed)
+    card_count = len(cube_ids)
+    card_limit = min(card_limit, card_count)
+    max_moves = max_moves if max_moves else 20 * card_limit + 100
+    rows = np.arange(games)
+
+    # DraftPile shuffles the cube, keeps the first card_limit cards and draws from the end
+    deck = rng.permuted(np.tile(cube_ids, (games, 1)), axis=1)[:, :card_limit]
+    location = np.zeros((games, card_limit), dtype=np.int8)
+    remaining = np.full(games, card_limit, dtype=np.int32)
+
+    pile_sizes = np.zeros((games, 3), dtype=np.int32)
+    current_pile = np.zeros(games, dtype=np.int8)
+    current_player = rng.integers(0, 2, size=games, dtype=np.int8)
+    starting_player = current_player.copy()
+
+    moves = np.zeros(games, dtype=np.int32)
+    blind_picks = np.zeros(games, dtype=np.int32)
+    taken_pile_sizes = np.zeros(MAX_PILE_SIZE + 1, dtype=np.int64)
+
+    def draw(mask, codes):
+        # Moves the next card of each masked game to `codes`, returns which games drew one
+        drew = mask & (remaining > 0)
+        remaining[drew] -= 1
+        location[rows[drew], remaining[drew]] = codes[drew]
+        return drew
+
+    # Deal the three starting piles
+    for pile in range(3):
+        drew = draw(np.ones(games, dtype=bool), np.full(games, IN_PILE[pile], dtype=np.int8))
+        pile_sizes[drew, pile] += 1
+
+    active = np.ones(games, dtype=bool)
+    for _ in range(max_moves):
+        active &= (remaining > 0) | pile_sizes.any(axis=1)
+        if not active.any():
+            break
+        moves[active] += 1
+
+        take = active & (rng.random(games) < take_probability)
+        passing = active & ~take
+
+        # Take: an empty pile is skipped for the next one, taking past the last pile just ends the turn
+        candidates = (pile_sizes > 0) & (np.arange(3) >= current_pile[:, None])
+        has_pile = candidates.any(axis=1)
+        chosen = candidates.argmax(axis=1).astype(np.int8)
+
+        taking = take & has_pile
+        if taking.any():
+            taken = taking[:, None] & (location == (chosen + 1)[:, None])
+            location[taken] = np.broadcast_to((TAKEN[0] + current_player)[:, None], location.shape)[taken]
+
+            sizes = pile_sizes[rows[taking], chosen[taking]]
+            taken_pile_sizes += np.bincount(np.minimum(sizes, MAX_PILE_SIZE), minlength=MAX_PILE_SIZE + 1)
+            pile_sizes[rows[taking], chosen[taking]] = 0
+
+            drew = draw(taking, chosen + 1)
+            pile_sizes[rows[drew], chosen[drew]] += 1
+
+        switching = take.copy()
+
+        # Pass: the passed pile gets a card, passing the last pile means a blind pick from the draft pile
+        if passing.any():
+            drew = draw(passing, current_pile + 1)
+            pile_sizes[rows[drew], current_pile[drew]] += 1
+
+            last_pile = passing & (current_pile == 2)
+            current_pile[passing & ~last_pile] += 1
+            current_pile[last_pile] = 0
+
+            blind = draw(last_pile, BLIND_PICK[0] + current_player)
+            blind_picks[blind] += 1
+            switching |= blind
+
+        current_player[switching] ^= 1
+        current_pile[switching] = 0
+
+    pools = np.stack([
+        ((location == TAKEN[player]) | (location == BLIND_PICK[player])).sum(axis=1)
+        for player in range(2)
+    ], axis=1)
+    id_count = int(cube_ids.max()) + 1 if card_count else 0
+
+    return {
+        'games': games,
+        'unfinished': int(active.sum()),
+        'moves': np.bincount(moves),
+        'blind_picks': np.bincount(blind_picks),
+        'taken_pile_sizes': taken_pile_sizes,
+        'starting_player_pool': np.bincount(pools[rows, starting_player], minlength=card_limit + 1),
+        'second_player_pool': np.bincount(pools[rows, starting_player ^ 1], minlength=card_limit + 1),
+        'card_taken': np.bincount(deck[np.isin(location, TAKEN)], minlength=id_count),
+        'card_blind_picked': np.bincount(deck[np.isin(location, BLIND_PICK)], minlength=id_count),
+        'card_dealt': np.bincount(deck.ravel(), minlength=id_count),
+    }
+
+
+def _mergeResults(results):
+    merged = {}
+    for result in results:
+        for key, value in result.items():
+            if key not in merged:
+                merged[key] = value
+            elif isinstance(value, np.ndarray):
+                size = max(len(value), len(merged[key]))
+                merged[key] = np.pad(merged[key], (0, size - len(merged[key]))) + np.pad(value, (0, size - len(value)))
+            else:
+                merged[key] += value
+    return merged
+
+
+def simulate(cube_ids, games, batch_size=10000, workers=None, seed=None, **kwargs):
+    # Spreads the games over a process pool in batches with independent seeds,
+    # the same seed always gives the same results
+    batches = [batch_size] * (games // batch_size) + ([games % batch_size] if games % batch_size else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(batches))
+
+    start = time.perf_counter()
+    if workers == 1 or len(batches) == 1:
+        results = [simulateBatch(cube_ids, size, seed=batch_seed, **kwargs) for size, batch_seed in zip(batches, seeds)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(simulateBatch, cube_ids, size, seed=batch_seed, **kwargs) for size, batch_seed in zip(batches, seeds)]
+            results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    merged = _mergeResults(results)
+    merged['seconds'] = elapsed
+    merged['games_per_second'] = games / elapsed if elapsed else float('inf')
+    return merged
+
+
+def _mean(histogram):
+    total = histogram.sum()
+    return (np.arange(len(histogram)) * histogram).sum() / total if total else 0.0
+
+
+def formatReport(results, names, top=10):
+    results_text = ""
+    results_text += f"Games: {results['games']} ({results['unfinished']} unfinished) in {results['seconds']:.2f}s, "
+    results_text += f"{results['games_per_second']:,.0f} games/s\n"
+    results_text += f"Moves per game: {_mean(results['moves']):.1f}\n"
+    results_text += f"Blind picks per game: {_mean(results['blind_picks']):.2f} "
+    results_text += f"(games with none: {results['blind_picks'][0] / results['games']:.1%})\n"
+    results_text += f"Taken pile size: mean {_mean(results['taken_pile_sizes']):.2f}, "
+    results_text += f"distribution {dict((size, int(count)) for size, count in enumerate(results['taken_pile_sizes']) if count)}\n"
+    results_text += f"Pool size: starting player {_mean(results['starting_player_pool']):.2f}, "
+    results_text += f"second player {_mean(results['second_player_pool']):.2f}\n"
+
+    dealt = np.maximum(results['card_dealt'], 1)
+    blind_rate = results['card_blind_picked'] / dealt
+    results_text += f"Most often blind picked:\n"
+    for card_id in np.argsort(-blind_rate)[:top]:
+        results_text += f"\t{names[card_id]}: {blind_rate[card_id]:.1%} of {results['card_dealt'][card_id]} deals\n"
+
+    return results_text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of random Winston drafts")
+    parser.add_argument("cube", nargs="?", default="draft_files/cube.txt")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--card-limit", type=int, default=90)
+    parser.add_argument("--take-probability", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    names, cube_ids = loadCubeIds(args.cube)
+    results = simulate(
+        cube_ids,
+        args.games,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        seed=args.seed,
+        card_limit=args.card_limit,
+        take_probability=args.take_probability,
+    )
+    print(formatReport(results, names))
+
+
+if __name__ == "__main__":
+    main()